@@ -0,0 +1,60 @@
+import os
+import pickle
+import sqlite3
+import time
+
+
+class AnalysisCache:
+    # Persistent per-file analysis (method ranges, imports, call sites, ...) in
+    # SQLite, keyed by a hash of the file content, so unchanged files are never
+    # re-analyzed. Once the stored size passes max_bytes, the least recently used
+    # entries are evicted.
+    def __init__(self, path="cache/analysis.sqlite", max_bytes=512 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis ("
+            "digest TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used)")
+        self.used = []
+
+    def get(self, digest):
+        row = self.conn.execute("SELECT data FROM analysis WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        self.used.append(digest)
+        return pickle.loads(row[0])
+
+    def put(self, digest, analysis):
+        data = pickle.dumps(analysis, protocol=pickle.HIGHEST_PROTOCOL)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO analysis (digest, data, size, last_used) VALUES (?, ?, ?, ?)",
+            (digest, data, len(data), time.time())
+        )
+
+    def commit(self):
+        # Recency updates are batched here rather than written on every get
+        now = time.time()
+        self.conn.executemany("UPDATE analysis SET last_used = ? WHERE digest = ?", ((now, d) for d in self.used))
+        self.used = []
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for digest, size in self.conn.execute("SELECT digest, size FROM analysis ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((digest,))
+            total -= size
+        self.conn.executemany("DELETE FROM analysis WHERE digest = ?", stale)
+
+    def close(self):
+        self.commit()
+        self.conn.close()
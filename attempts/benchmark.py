@@ -0,0 +1,195 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Timed stages of one matching run, in order
+STAGES = ["load_summaries", "load_corpus", "build_indexes", "match", "write"]
+
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def corpus_names(data_root):
+    names = []
+    for name in sorted(os.listdir(data_root)):
+        path = os.path.join(data_root, name)
+        if os.path.isdir(path) and any(f.endswith(".java") for _, _, files in os.walk(path) for f in files):
+            names.append(name)
+    return names
+
+
+def entry_subset(entries, size):
+    # A fixed subset: every k-th entry, so it spans all models and is the same on every run
+    if size is None or size >= len(entries):
+        return entries
+    step = len(entries) / size
+    return [entries[int(i * step)] for i in range(size)]
+
+
+def run_case(data_root, corpus, subset_size, cache_mode, backend):
+    # Runs in its own process, so peak RSS belongs to this case only
+    from analysis_cache import AnalysisCache
+    from corpus import load_java_files
+    from parser_backends import get_backend
+    from result_writer import ResultWriter
+    from instrumentation import stats
+    from summaries import load_summaries
+    import match_engine
+    from match_engine import MatchOptions, shards_of
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        entries = entry_subset(load_summaries(os.path.join(data_root, "yaml_summaries.csv"), cache_dir=tmp), subset_size)
+        stages["load_summaries"] = time.perf_counter() - start
+
+        cache = None
+        java_root = os.path.join(data_root, corpus)
+        if cache_mode == "warm":
+            # Fill the cache untimed, so the timed load measures cache hits
+            cache = AnalysisCache(os.path.join(tmp, "analysis.sqlite"))
+            load_java_files(java_root, relative_to=data_root, cache=cache, backend=get_backend(backend))
+        start = time.perf_counter()
+        java_files = load_java_files(java_root, relative_to=data_root, cache=cache, backend=get_backend(backend))
+        stages["load_corpus"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        match_engine.build_state(entries, java_files)
+        stages["build_indexes"] = time.perf_counter() - start
+
+        # The matched_at_most_10.py run: the first 10 matches per entry, in yaml2code's shards
+        options = MatchOptions(outputs=("top",), top_n=10)
+        # Counters from here on belong to the timed match only
+        stats.reset()
+        start = time.perf_counter()
+        rows = []
+        for shard in shards_of(len(entries), 50):
+            _, shard_rows = match_engine.match_shard(shard, options)
+            for outputs in shard_rows:
+                rows.extend(outputs["top"])
+        stages["match"] = time.perf_counter() - start
+        # Call sites the engine actually looked at, after the import filter,
+        # shared searches and the stop at the first top_n matches
+        examined = stats.counters.get("sites_examined", 0)
+
+        start = time.perf_counter()
+        with ResultWriter(os.path.join(tmp, "results.csv")) as writer:
+            writer.write_rows(rows)
+        stages["write"] = time.perf_counter() - start
+
+    return {
+        "corpus": corpus,
+        "entries_subset": subset_size or "all",
+        "files": len(java_files),
+        "bytes": sum(len(f["code"]) for f in java_files),
+        "entries": len(entries),
+        "sites_examined": examined,
+        "matched_rows": sum(1 for row in rows if row["Matched"] == "T"),
+        "rows": len(rows),
+        "stages": stages,
+        "total_seconds": sum(stages.values()),
+        "files_per_second": len(java_files) / stages["load_corpus"] if stages["load_corpus"] else None,
+        "entries_per_second": len(entries) / stages["match"] if stages["match"] else None,
+        "sites_examined_per_second": examined / stages["match"] if stages["match"] else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def measure(data_root, corpus, subset_size, cache_mode, backend, repeat):
+    # Best of repeat runs, each in a fresh spawned process
+    best = None
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repeat):
+        with context.Pool(1) as pool:
+            result = pool.apply(run_case, (data_root, corpus, subset_size, cache_mode, backend))
+        if best is None or result["total_seconds"] < best["total_seconds"]:
+            best = result
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(case):
+    return f"{case['corpus']}/{case['entries_subset']}"
+
+
+def compare(results, baseline_path, threshold):
+    # Cases whose total time grew by more than threshold (a fraction) over the baseline
+    with open(baseline_path) as f:
+        baseline = {case_key(c): c for c in json.load(f)["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        old = baseline.get(case_key(case))
+        if old is None:
+            continue
+        ratio = case["total_seconds"] / old["total_seconds"] if old["total_seconds"] else 1.0
+        rss_ratio = case["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else 1.0
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{case_key(case):40} time x{ratio:.2f}  rss x{rss_ratio:.2f}  {flag}")
+        if flag:
+            regressions.append(case_key(case))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the matcher on each bundled corpus and fixed subsets of the summaries")
+    parser.add_argument("--data", default="data", help="directory holding the corpora and yaml_summaries.csv")
+    parser.add_argument("--corpora", nargs="+", help="corpus directories under --data (default: all)")
+    parser.add_argument("--entries", nargs="+", default=["100", "1000", "all"],
+                        help="summary subset sizes (every k-th entry); 'all' for every entry")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold",
+                        help="cold: analyze every file; warm: time loading from a pre-filled analysis cache")
+    parser.add_argument("--backend", default="regex", help="parser backend (see parser_backends)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case; the fastest is kept")
+    parser.add_argument("--json", dest="json_path", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="with --compare, fail when a case is this much slower (fraction)")
+    args = parser.parse_args()
+
+    subsets = [None if size == "all" else int(size) for size in args.entries]
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cache": args.cache,
+        "backend": args.backend,
+        "cases": []
+    }
+    for corpus in args.corpora or corpus_names(args.data):
+        for subset_size in subsets:
+            case = measure(args.data, corpus, subset_size, args.cache, args.backend, args.repeat)
+            results["cases"].append(case)
+            stages = " ".join(f"{stage}={case['stages'][stage]:.2f}s" for stage in STAGES)
+            print(f"{case_key(case):40} {case['files']:6} files {case['files_per_second']:8.1f} files/s "
+                  f"{case['entries_per_second']:9.1f} entries/s {case['sites_examined_per_second']:10.1f} sites examined/s "
+                  f"{case['peak_rss_mb']:7.1f} MB  {stages}")
+
+    if args.json_path:
+        os.makedirs(os.path.dirname(args.json_path) or ".", exist_ok=True)
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved to {args.json_path}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
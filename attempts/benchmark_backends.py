@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import time
+
+from corpus import SourceLines
+from java_index import SymbolTable
+from parser_backends import available_backends, get_backend
+
+
+def read_corpus(root, limit=None):
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for name in sorted(names):
+            if name.endswith(".java"):
+                path = os.path.join(dirpath, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    files.append((os.path.relpath(path, root), SourceLines(f.read())))
+                if limit and len(files) >= limit:
+                    return files
+    return files
+
+
+def run_backend(name, files):
+    backend = get_backend(name)
+    start = time.perf_counter()
+    analyses = {filename: backend.analyze(lines) for filename, lines in files}
+    seconds = time.perf_counter() - start
+    return backend, analyses, seconds
+
+
+def overlap(reference, other):
+    # Share of each side found by the other, and Jaccard similarity
+    common = len(reference & other)
+    return {
+        "reference": len(reference),
+        "backend": len(other),
+        "common": common,
+        "recall": common / len(reference) if reference else 1.0,
+        "precision": common / len(other) if other else 1.0,
+        "jaccard": common / len(reference | other) if reference | other else 1.0
+    }
+
+
+def agreement(reference, analyses):
+    methods = [set(), set()]
+    sites = [set(), set()]
+    for side, result in enumerate((reference, analyses)):
+        for filename, analysis in result.items():
+            methods[side].update((filename, start, end) for start, end, _ in analysis["methods"])
+            sites[side].update((filename, line_idx, receiver, name) for line_idx, receiver, name, _ in analysis["call_sites"])
+
+    # Declared type of the receiver at every call site both backends found
+    same = total = 0
+    tables = {}
+    for side, result in enumerate((reference, analyses)):
+        tables[side] = {f: SymbolTable(a["methods"], a["declarations"]) for f, a in result.items()}
+    for filename, line_idx, receiver, _ in sites[0] & sites[1]:
+        total += 1
+        same += tables[0][filename].lookup(line_idx - 1, receiver) == tables[1][filename].lookup(line_idx - 1, receiver)
+
+    return {
+        "methods": overlap(*methods),
+        "call_sites": overlap(*sites),
+        "declared_types": {"compared": total, "agree": same / total if total else 1.0}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parser backends: throughput and agreement with the regex backend")
+    parser.add_argument("--root", default="data", help="corpus directory")
+    parser.add_argument("--backends", nargs="+", default=None, help="backends to run (default: every installed one)")
+    parser.add_argument("--limit", type=int, default=None, help="only the first N files")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    files = read_corpus(args.root, args.limit)
+    size = sum(len(lines.code) for _, lines in files)
+    names = args.backends or available_backends()
+    if "regex" not in names:
+        names = ["regex"] + names
+
+    results = {"root": args.root, "files": len(files), "bytes": size, "backends": {}}
+    reference = None
+    for name in names:
+        backend, analyses, seconds = run_backend(name, files)
+        result = {
+            "seconds": seconds,
+            "files_per_second": len(files) / seconds if seconds else None,
+            "mb_per_second": size / seconds / 1e6 if seconds else None,
+            "fallbacks": backend.fallbacks,
+            "methods": sum(len(a["methods"]) for a in analyses.values()),
+            "call_sites": sum(len(a["call_sites"]) for a in analyses.values())
+        }
+        if reference is None:
+            reference = analyses
+        else:
+            result["agreement"] = agreement(reference, analyses)
+        results["backends"][name] = result
+
+        print(f"{name:12} {seconds:8.2f}s {result['files_per_second']:9.1f} files/s {result['mb_per_second']:6.2f} MB/s "
+              f"methods={result['methods']} call_sites={result['call_sites']} fallbacks={result['fallbacks']}")
+        if "agreement" in result:
+            agree = result["agreement"]
+            print(f"{'':12} vs regex: methods jaccard={agree['methods']['jaccard']:.3f} "
+                  f"call sites jaccard={agree['call_sites']['jaccard']:.3f} "
+                  f"declared types agree={agree['declared_types']['agree']:.3f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from instrumentation import stats
+from result_writer import ResultWriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Column order of the CSV results
+RESULT_COLUMNS = [
+    "ID", "Matched", "Model", "Package", "FunctionName", "Summary", "File",
+    "LineNumber", "LineContent", "MotherLine", "MotherBody", "DeclaredType"
+]
+
+EXTENSIONS = {"parquet": "parquet", "feather": "feather"}
+
+mother_line_pattern = re.compile(r"^\((\d+), (\d+)\)$")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for parquet/feather results (pip install pyarrow)")
+
+
+def columnar_paths(prefix, format="parquet"):
+    ext = EXTENSIONS[format]
+    return f"{prefix}.matches.{ext}", f"{prefix}.methods.{ext}"
+
+
+# A value as it appears in the CSV export (pandas writes None/NaN as an empty field)
+def csv_text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value)
+
+
+class ColumnarResultWriter:
+    # Same interface as ResultWriter, but writes two tables: match rows without the
+    # MotherBody text, and a methods table (MethodID, File, Start, End, Body) holding
+    # each distinct enclosing method once. Match rows point at it through MethodID.
+    # Every other column is stored as its CSV text, so the CSV can be rebuilt exactly.
+    def __init__(self, prefix, format="parquet", batch_size=1000):
+        require_pyarrow()
+        self.match_path, self.method_path = columnar_paths(prefix, format)
+        self.format = format
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.columns = None
+        self.method_ids = {}
+        self.buffer = []
+        self.method_buffer = []
+        self.match_writer = None
+        self.method_writer = None
+        self.closed = False
+
+    def write(self, row):
+        if self.columns is None:
+            self.columns = list(row)
+        record = {c: csv_text(row[c]) for c in self.columns if c != "MotherBody"}
+        record["MethodID"] = self.method_id(record["File"], record.get("MotherLine", ""), csv_text(row.get("MotherBody")))
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def method_id(self, filename, mother_line, body):
+        if not body:
+            return None
+        # Keyed on the body digest, not the line range: rows without an enclosing
+        # method can carry other text (e.g. the call line) under an empty range
+        key = (filename, hashlib.blake2b(body.encode("utf-8"), digest_size=16).digest())
+        method_id = self.method_ids.get(key)
+        if method_id is None:
+            method_id = self.method_ids[key] = len(self.method_ids)
+            span = mother_line_pattern.match(mother_line)
+            self.method_buffer.append({
+                "MethodID": method_id,
+                "File": filename,
+                "Start": int(span.group(1)) if span else None,
+                "End": int(span.group(2)) if span else None,
+                "Body": body
+            })
+        return method_id
+
+    def open_writers(self):
+        columns = self.columns or RESULT_COLUMNS
+        self.match_schema = pa.schema(
+            [(c, pa.string()) for c in columns if c != "MotherBody"] + [("MethodID", pa.int64())],
+            metadata={"csv_columns": json.dumps(columns)}
+        )
+        self.method_schema = pa.schema([
+            ("MethodID", pa.int64()), ("File", pa.string()),
+            ("Start", pa.int64()), ("End", pa.int64()), ("Body", pa.string())
+        ])
+        if self.format == "parquet":
+            self.match_writer = pq.ParquetWriter(self.match_path, self.match_schema, compression="zstd")
+            self.method_writer = pq.ParquetWriter(self.method_path, self.method_schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            self.match_writer = pa.ipc.new_file(self.match_path, self.match_schema, options=options)
+            self.method_writer = pa.ipc.new_file(self.method_path, self.method_schema, options=options)
+
+    def flush(self):
+        if self.match_writer is None:
+            self.open_writers()
+        with stats.stage("write"):
+            if self.buffer:
+                stats.count("rows_written", len(self.buffer))
+                self.match_writer.write_table(pa.Table.from_pylist(self.buffer, schema=self.match_schema))
+                self.rows_written += len(self.buffer)
+                self.buffer = []
+            if self.method_buffer:
+                self.method_writer.write_table(pa.Table.from_pylist(self.method_buffer, schema=self.method_schema))
+                self.method_buffer = []
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.match_writer.close()
+        self.method_writer.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_schema(path, format):
+    if format == "parquet":
+        return pq.read_schema(path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def read_table(path, format, columns=None):
+    if format == "parquet":
+        return pq.read_table(path, columns=columns)
+    return feather.read_table(path, columns=columns)
+
+
+# Load match rows, reading only the requested columns; MotherBody is joined in
+# from the methods table only when asked for
+def read_results(prefix, columns=None, format="parquet"):
+    require_pyarrow()
+    match_path, method_path = columnar_paths(prefix, format)
+    csv_columns = json.loads(read_schema(match_path, format).metadata[b"csv_columns"])
+    wanted = columns or csv_columns
+    stored = [c for c in wanted if c != "MotherBody"]
+    if "MotherBody" in wanted and "MethodID" not in stored:
+        stored.append("MethodID")
+    df = read_table(match_path, format, columns=stored).to_pandas()
+    if "MotherBody" in wanted:
+        methods = read_table(method_path, format, columns=["MethodID", "Body"]).to_pandas()
+        bodies = dict(zip(methods["MethodID"], methods["Body"]))
+        df["MotherBody"] = [bodies[m] if pd.notna(m) else "" for m in df["MethodID"]]
+    return df[wanted]
+
+
+def columnar_to_csv(prefix, csv_path, format="parquet"):
+    require_pyarrow()
+    match_path, method_path = columnar_paths(prefix, format)
+    methods = read_table(method_path, format, columns=["MethodID", "Body"])
+    bodies = dict(zip(methods.column("MethodID").to_pylist(), methods.column("Body").to_pylist()))
+    matches = read_table(match_path, format)
+    csv_columns = json.loads(matches.schema.metadata[b"csv_columns"])
+    with ResultWriter(csv_path) as writer:
+        for batch in matches.to_batches():
+            for record in batch.to_pylist():
+                method_id = record.pop("MethodID")
+                record["MotherBody"] = bodies[method_id] if method_id is not None else ""
+                writer.write({c: record[c] for c in csv_columns})
+
+
+def csv_to_columnar(csv_path, prefix, format="parquet", chunksize=10000):
+    # Read every field as text so the rebuilt CSV matches the input
+    with ColumnarResultWriter(prefix, format) as writer:
+        for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+            writer.write_rows(chunk.to_dict("records"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert match results between CSV and columnar (parquet/feather) form")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_columnar = sub.add_parser("to-columnar", help="split a results CSV into matches and methods tables")
+    to_columnar.add_argument("csv")
+    to_columnar.add_argument("--prefix", help="output prefix (default: the CSV path without .csv)")
+    to_columnar.add_argument("--format", choices=sorted(EXTENSIONS), default="parquet")
+    to_csv = sub.add_parser("to-csv", help="rebuild the results CSV from the columnar tables")
+    to_csv.add_argument("prefix")
+    to_csv.add_argument("--output", help="CSV path (default: <prefix>.csv)")
+    to_csv.add_argument("--format", choices=sorted(EXTENSIONS), default="parquet")
+    args = parser.parse_args()
+
+    if args.command == "to-columnar":
+        prefix = args.prefix or os.path.splitext(args.csv)[0]
+        csv_to_columnar(args.csv, prefix, args.format)
+        print("Saved to", *columnar_paths(prefix, args.format))
+    else:
+        output = args.output or f"{args.prefix}.csv"
+        columnar_to_csv(args.prefix, output, args.format)
+        print(f"Rebuilt CSV saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
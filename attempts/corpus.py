@@ -0,0 +1,217 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+
+from instrumentation import stats
+from java_index import ANALYSIS_VERSION, MethodIndex, SymbolTable
+from java_lexer import mask_source
+from parser_backends import RegexBackend
+
+
+# Every separator str.splitlines() splits on
+line_break_pattern = re.compile(r"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+class SourceLines:
+    # The lines of one file (same as code.splitlines()) as slices of the file
+    # text: one buffer plus start/end offsets per line, instead of a second copy
+    # of the file as a list of strings. Lines are only materialized when read.
+    __slots__ = ("code", "starts", "ends", "plain", "masked_lines")
+
+    def __init__(self, code):
+        self.code = code
+        self.starts = array("I")
+        self.ends = array("I")
+        # With "\n" as the only separator, a run of lines joined by "\n" is a plain slice of code
+        self.plain = True
+        self.masked_lines = None
+        pos = 0
+        for match in line_break_pattern.finditer(code):
+            self.starts.append(pos)
+            self.ends.append(match.start())
+            pos = match.end()
+            if self.plain and match.group() != "\n":
+                self.plain = False
+        if pos < len(code):
+            self.starts.append(pos)
+            self.ends.append(len(code))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.code[s:e] for s, e in zip(self.starts[i], self.ends[i])]
+        return self.code[self.starts[i]:self.ends[i]]
+
+    def __iter__(self):
+        code = self.code
+        return (code[s:e] for s, e in zip(self.starts, self.ends))
+
+    def masked(self):
+        # The same lines with comments and string/char literal contents blanked
+        # (java_lexer.mask_source); offsets are shared, the buffer is lexed once
+        # per analysis and released (release_masked) once the file is analyzed
+        if self.masked_lines is None:
+            masked = SourceLines.__new__(SourceLines)
+            masked.code = mask_source(self.code)
+            masked.starts = self.starts
+            masked.ends = self.ends
+            masked.plain = self.plain
+            masked.masked_lines = masked
+            self.masked_lines = masked
+        return self.masked_lines
+
+    def release_masked(self):
+        # The masked copy refers to itself; break that so it is freed right away
+        if self.masked_lines is not None and self.masked_lines is not self:
+            self.masked_lines.masked_lines = None
+        self.masked_lines = None
+
+    def text(self, first, last):
+        # "\n".join(self[first:last + 1]), without building the list when possible
+        if first > last or first >= len(self):
+            return ""
+        last = min(last, len(self) - 1)
+        if self.plain:
+            return self.code[self.starts[first]:self.ends[last]]
+        return "\n".join(self[first:last + 1])
+
+
+def cache_key(content_sha1, backend="regex"):
+    return f"{ANALYSIS_VERSION}:{backend}:{content_sha1}"
+
+
+def content_digest(code, backend="regex"):
+    return cache_key(hashlib.sha1(code.encode("utf-8")).hexdigest(), backend)
+
+
+# Load all .java files under root. Each file is analyzed once here (or its analysis
+# is taken from the cache when its content is unchanged); method boundaries and
+# declarations are indexed. backend is a parser_backends backend (default: regex).
+def load_java_files(root, relative_to="data", cache=None, backend=None):
+    if backend is None:
+        backend = RegexBackend()
+    java_files = []
+    with stats.stage("load_corpus"):
+        for path in java_paths(root):
+            with stats.stage("read_files"), open(path, "r", encoding="utf-8") as f:
+                code = f.read()
+                stats.count("files_read")
+                stats.count("bytes_read", os.fstat(f.fileno()).st_size)
+            java_files.append(java_file_record(os.path.relpath(path, relative_to), code, cache, backend))
+        if cache is not None:
+            cache.commit()
+    return java_files
+
+
+def java_paths(root):
+    for dirpath, _, files in os.walk(root):
+        for file in files:
+            if file.endswith(".java"):
+                yield os.path.join(dirpath, file)
+
+
+def java_file_record(filename, code, cache, backend, content_sha1=None):
+    # content_sha1: hex SHA-1 of the UTF-8 code when already known (packs store it)
+    lines = SourceLines(code)
+
+    analysis = None
+    if cache is not None:
+        if content_sha1 is None:
+            digest = content_digest(code, backend.name)
+        else:
+            digest = cache_key(content_sha1, backend.name)
+        analysis = cache.get(digest)
+        stats.count("cache_misses" if analysis is None else "cache_hits")
+    if analysis is None:
+        analysis = backend.analyze(lines)
+        # The masked copy is only needed by the scans; keeping it would double the text held per file
+        lines.release_masked()
+        if cache is not None:
+            cache.put(digest, analysis)
+
+    return {
+        "filename": filename,
+        "lines": lines,
+        "code": code,
+        "analysis": analysis,
+        "methods": MethodIndex(lines, analysis["methods"]),
+        "symbols": SymbolTable(analysis["methods"], analysis["declarations"])
+    }
+
+
+# The analysis of a record (every call site with its argument text, imports,
+# declarations) is only read by CallSiteIndex.build and ImportIndex.build; drop
+# it once the indexes exist so it is not held for the whole run
+def drop_analyses(java_files):
+    for java_file in java_files:
+        java_file.pop("analysis", None)
+
+
+# A corpus pack: every .java file under a root in one file, so loading is one
+# sequential read of a read-only memory map instead of a directory walk and an
+# open per file. Spawned worker processes map the same file and share its pages
+# through the page cache. Layout:
+#   header  PACK_MAGIC, index offset, index length
+#   data    the UTF-8 text of each file (as read in text mode), back to back
+#   index   JSON: file name, offset, length and SHA-1 of each file, in walk order
+# The file names are stored as load_java_files would give them, and the SHA-1
+# is the analysis cache key, so files are not hashed again on load.
+PACK_MAGIC = b"Y2CPACK1"
+PACK_HEADER = struct.Struct("<8sQQ")
+
+
+def write_pack(root, path, relative_to="data"):
+    index = []
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as out:
+        out.write(PACK_HEADER.pack(PACK_MAGIC, 0, 0))
+        for java_path in java_paths(root):
+            with open(java_path, "r", encoding="utf-8") as f:
+                data = f.read().encode("utf-8")
+            index.append([os.path.relpath(java_path, relative_to), out.tell(), len(data), hashlib.sha1(data).hexdigest()])
+            out.write(data)
+        index_offset = out.tell()
+        index_data = json.dumps({"files": index}).encode("utf-8")
+        out.write(index_data)
+        out.seek(0)
+        out.write(PACK_HEADER.pack(PACK_MAGIC, index_offset, len(index_data)))
+    os.replace(tmp, path)
+    return len(index), index_offset - PACK_HEADER.size
+
+
+def load_packed_java_files(path, cache=None, backend=None):
+    if backend is None:
+        backend = RegexBackend()
+    java_files = []
+    with stats.stage("load_corpus"):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            magic, index_offset, index_length = PACK_HEADER.unpack_from(mapped)
+            if magic != PACK_MAGIC:
+                raise ValueError(f"{path} is not a corpus pack")
+            index = json.loads(mapped[index_offset:index_offset + index_length])["files"]
+            with memoryview(mapped) as view:
+                for filename, offset, length, content_sha1 in index:
+                    # Decoded straight from the mapped pages
+                    with stats.stage("read_files"):
+                        code = str(view[offset:offset + length], "utf-8")
+                    stats.count("files_read")
+                    stats.count("bytes_read", length)
+                    java_files.append(java_file_record(filename, code, cache, backend, content_sha1))
+        if cache is not None:
+            cache.commit()
+    return java_files
+
+
+# A corpus directory, or a pack written by write_pack (relative_to is then fixed by the pack)
+def load_corpus(root, relative_to="data", cache=None, backend=None):
+    if os.path.isfile(root):
+        return load_packed_java_files(root, cache, backend)
+    return load_java_files(root, relative_to, cache, backend)
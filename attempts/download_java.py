@@ -1,5 +1,19 @@
+import argparse
+import hashlib
+import json
 import os
+import struct
+import sys
+import tarfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
 
 OWNER = "apache"
 REPO = "doris"
@@ -7,48 +21,333 @@ BRANCH = "master"
 TARGET_DIR_SUFFIX = "fe/fe-core/src/main/java"
 LOCAL_DIR = "data/doris-fe-core"
 
-# Step 1: Get latest commit SHA for the branch
-branch_info_url = f"https://api.github.com/repos/{OWNER}/{REPO}/branches/{BRANCH}"
-resp = requests.get(branch_info_url)
-resp.raise_for_status()
-COMMIT_SHA = resp.json()["commit"]["sha"]
+API_URL = "https://api.github.com"
+RAW_URL = "https://raw.githubusercontent.com"
+
+# Worth another try: rate limiting and server-side failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# and connections that fail or drop partway through a response body
+RETRY_ERRORS = (
+    requests.ConnectionError, requests.Timeout,
+    requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError
+)
+
+
+def make_session(workers):
+    # One session for every thread: connections are kept alive and reused, up to workers at a time
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "doris-java-downloader"
+    })
+    token = os.environ.get("GITHUB_TOKEN")
+    if token:
+        session.headers["Authorization"] = f"Bearer {token}"
+    return session
+
+
+def retry_after(resp, default):
+    # Retry-After is either a number of seconds or an HTTP date; anything else gets the backoff delay
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def fetch(session, url, retries=5, backoff=0.5, timeout=30, stream=False):
+    # GET with retries on connection errors and RETRY_STATUSES, waiting
+    # backoff * 2^attempt seconds between attempts (or what Retry-After asks)
+    for attempt in range(retries + 1):
+        try:
+            resp = session.get(url, timeout=timeout, stream=stream)
+            if resp.status_code not in RETRY_STATUSES:
+                resp.raise_for_status()
+                return resp
+            wait = retry_after(resp, backoff * 2 ** attempt)
+            error = requests.HTTPError(f"{resp.status_code} for {url}", response=resp)
+            # Release the connection (held open for stream=True) before waiting
+            resp.close()
+        except RETRY_ERRORS as e:
+            wait = backoff * 2 ** attempt
+            error = e
+        if attempt == retries:
+            raise error
+        time.sleep(wait)
+
+
+def blob_sha(content):
+    # The git blob id of the content, as listed in the tree
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
 
-print(f"Using commit SHA: {COMMIT_SHA}")
 
-# Step 2: Get repo tree recursively
-GITHUB_API_URL = f"https://api.github.com/repos/{OWNER}/{REPO}/git/trees/{COMMIT_SHA}?recursive=1"
-RAW_BASE_URL = f"https://raw.githubusercontent.com/{OWNER}/{REPO}/{COMMIT_SHA}/"
+def list_java_files(session, api_url, owner, repo, branch, suffix, retries=5):
+    commit_sha = fetch(session, f"{api_url}/repos/{owner}/{repo}/branches/{branch}", retries).json()["commit"]["sha"]
+    tree = fetch(session, f"{api_url}/repos/{owner}/{repo}/git/trees/{commit_sha}?recursive=1", retries).json()["tree"]
+    java_files = [
+        item for item in tree
+        if item["type"] == "blob"
+        and item["path"].endswith(".java")
+        and suffix in item["path"]
+    ]
+    return commit_sha, java_files
 
-headers = {
-    "Accept": "application/vnd.github.v3+json",
-    "User-Agent": "doris-java-downloader"
-}
 
-resp = requests.get(GITHUB_API_URL, headers=headers)
-resp.raise_for_status()
-tree = resp.json()["tree"]
+class Manifest:
+    # Blob SHA of every file already downloaded, keyed by its path in the
+    # repository. Saved as JSON next to the output directory, every save_every
+    # files and at the end, so an interrupted run resumes where it stopped.
+    def __init__(self, path, save_every=100):
+        self.path = path
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)["files"]
 
-# Step 3: Find all .java files under TARGET_DIR_SUFFIX
-java_files = [
-    item for item in tree
-    if item["type"] == "blob"
-    and item["path"].endswith(".java")
-    and TARGET_DIR_SUFFIX in item["path"]
-]
+    def unchanged(self, path, sha, local_path):
+        return self.files.get(path) == sha and os.path.exists(local_path)
 
-print(f"Found {len(java_files)} Java files.")
+    def record(self, path, sha):
+        with self.lock:
+            self.files[path] = sha
+            self.unsaved += 1
+            if self.unsaved >= self.save_every:
+                self.save_locked()
 
-# Step 4: Download each file
-for file in java_files:
-    file_path = file["path"]
-    rel_path = file_path.split(TARGET_DIR_SUFFIX, 1)[1].lstrip("/")
-    local_path = os.path.join(LOCAL_DIR, rel_path)
+    def save(self):
+        with self.lock:
+            self.save_locked()
 
-    raw_url = RAW_BASE_URL + file_path
+    def save_locked(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.unsaved = 0
 
-    print(f"Downloading {file_path} → {local_path}")
+
+def write_file(local_path, content):
     os.makedirs(os.path.dirname(local_path), exist_ok=True)
-    raw_content = requests.get(raw_url).text
+    # Written under a temporary name first, so an interrupted write never leaves a partial file
+    tmp = f"{local_path}.part"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, local_path)
+
+
+def download_file(session, raw_base, item, local_path, manifest, retries=5, backoff=0.5):
+    # A body that does not hash to the listed blob was cut short or mangled on
+    # the way; it is fetched again, with the same backoff as fetch
+    for attempt in range(retries + 1):
+        content = fetch(session, raw_base + item["path"], retries, backoff).content
+        if blob_sha(content) == item["sha"]:
+            break
+        if attempt == retries:
+            raise ValueError(f"{item['path']}: content does not match blob {item['sha']}")
+        time.sleep(backoff * 2 ** attempt)
+    write_file(local_path, content)
+    manifest.record(item["path"], item["sha"])
+    return len(content)
+
+
+def download_all(session, raw_base, java_files, suffix, local_dir, manifest, workers=8, retries=5, backoff=0.5):
+    pending = []
+    for item in java_files:
+        rel_path = item["path"].split(suffix, 1)[1].lstrip("/")
+        local_path = os.path.join(local_dir, rel_path)
+        if not manifest.unchanged(item["path"], item["sha"], local_path):
+            pending.append((item, local_path))
+    print(f"{len(java_files) - len(pending)} unchanged, {len(pending)} to download.")
+
+    done = failed = size = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(download_file, session, raw_base, item, local_path, manifest, retries, backoff): item
+            for item, local_path in pending
+        }
+        for future in as_completed(futures):
+            try:
+                size += future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"Failed {futures[future]['path']}: {e}")
+            if (done + failed) % 500 == 0:
+                print(f"{done + failed}/{len(pending)} files")
+    manifest.save()
+    return done, failed, size
+
+
+# Archive mode: one tarball or zipball of the repository, read as it arrives.
+# Only the .java members under suffix are kept, and the archive itself is
+# never written to disk.
+
+def member_target(name, suffix, local_dir):
+    # Members are named <owner>-<repo>-<sha>/<path>. Returns the path in the
+    # repository and the local path for a .java file under suffix, else None.
+    path = name.split("/", 1)[1] if "/" in name else ""
+    if not path.endswith(".java") or suffix not in path:
+        return None
+    rel_path = os.path.normpath(path.split(suffix, 1)[1].lstrip("/"))
+    if os.path.isabs(rel_path) or rel_path.startswith(".."):
+        return None
+    return path, os.path.join(local_dir, rel_path)
+
+
+def iter_tar_members(stream, wanted):
+    # r|* reads the (compressed) tar strictly forward, no seeking
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile() and wanted(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+
+class StreamReader:
+    # Exact-length reads from a file-like stream, with bytes that were read
+    # ahead pushed back for the next read
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.pending = b""
+
+    def read(self, n):
+        data = self.pending[:n]
+        self.pending = self.pending[n:]
+        while len(data) < n:
+            chunk = self.stream.read(max(n - len(data), self.chunk_size))
+            if not chunk:
+                break
+            data += chunk
+        if len(data) > n:
+            self.pending = data[n:] + self.pending
+            data = data[:n]
+        return data
+
+    def read_some(self):
+        if self.pending:
+            data, self.pending = self.pending, b""
+            return data
+        return self.stream.read(self.chunk_size)
+
+    def unread(self, data):
+        self.pending = data + self.pending
+
+
+def iter_zip_members(stream, wanted):
+    # Walks the local file headers front to back instead of seeking to the
+    # central directory at the end. Members are stored or deflated; when the
+    # sizes follow the data (flag bit 3), the deflate stream's end marks the
+    # end of the member.
+    reader = StreamReader(stream)
+    while True:
+        header = reader.read(30)
+        if len(header) < 30 or header[:4] != b"PK\x03\x04":
+            return  # central directory (or end of stream)
+        flags, method = struct.unpack("<HH", header[6:10])
+        compressed_size, = struct.unpack("<I", header[18:22])
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        name = reader.read(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        reader.read(extra_length)
+        if method not in (0, 8):
+            raise ValueError(f"{name}: unsupported zip compression method {method}")
+
+        if not flags & 0x08:
+            data = reader.read(compressed_size)
+            if wanted(name):
+                yield name, zlib.decompress(data, -15) if method == 8 else data
+            continue
+
+        if method != 8:
+            raise ValueError(f"{name}: stored zip member without sizes cannot be streamed")
+        inflater = zlib.decompressobj(-15)
+        parts = []
+        while not inflater.eof:
+            chunk = reader.read_some()
+            if not chunk:
+                raise ValueError(f"{name}: archive ends inside a member")
+            parts.append(inflater.decompress(chunk))
+        reader.unread(inflater.unused_data)
+        # Data descriptor: optional signature, CRC-32, compressed and uncompressed size
+        reader.read(12 if reader.read(4) == b"PK\x07\x08" else 8)
+        if wanted(name):
+            yield name, b"".join(parts)
+
+
+def extract_archive(session, url, kind, suffix, local_dir, manifest, retries=5, backoff=0.5):
+    resp = fetch(session, url, retries, backoff, timeout=60, stream=True)
+    # Undo any transfer encoding; the archive's own compression is handled below
+    resp.raw.decode_content = True
+    iter_members = iter_tar_members if kind == "tarball" else iter_zip_members
+    files = size = 0
+    with resp:
+        for name, content in iter_members(resp.raw, lambda name: member_target(name, suffix, local_dir) is not None):
+            path, local_path = member_target(name, suffix, local_dir)
+            write_file(local_path, content)
+            manifest.record(path, blob_sha(content))
+            files += 1
+            size += len(content)
+    manifest.save()
+    return files, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the .java files under one directory of a GitHub repository")
+    parser.add_argument("--owner", default=OWNER)
+    parser.add_argument("--repo", default=REPO)
+    parser.add_argument("--branch", default=BRANCH)
+    parser.add_argument("--suffix", default=TARGET_DIR_SUFFIX, help="directory in the repository to take .java files from")
+    parser.add_argument("--output", default=LOCAL_DIR, help="local directory the files are written to")
+    parser.add_argument("--manifest", help="JSON of downloaded blob SHAs (default: <output>.manifest.json)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent downloads")
+    parser.add_argument("--retries", type=int, default=5, help="retries per request")
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay in seconds, doubled on each retry")
+    parser.add_argument("--api-url", default=API_URL, help="GitHub API base URL (or a local stand-in)")
+    parser.add_argument("--raw-url", default=RAW_URL, help="raw file base URL (or a local stand-in)")
+    parser.add_argument("--archive", choices=["tarball", "zipball"],
+                        help="fetch one archive of the branch and stream-extract the files, instead of one request per file")
+    parser.add_argument("--archive-url", help="with --archive: URL of the archive (default: the GitHub API archive link)")
+    args = parser.parse_args()
+
+    session = make_session(args.workers)
+    manifest = Manifest(args.manifest or f"{args.output.rstrip(os.sep)}.manifest.json")
+    start = time.perf_counter()
+    if args.archive:
+        url = args.archive_url or f"{args.api_url}/repos/{args.owner}/{args.repo}/{args.archive}/{args.branch}"
+        print(f"Extracting {url}")
+        files, size = extract_archive(session, url, args.archive, args.suffix, args.output, manifest, args.retries, args.backoff)
+        seconds = time.perf_counter() - start
+        print(f"Extracted {files} Java files ({size / 1e6:.1f} MB) in {seconds:.1f}s to {args.output}.")
+        return
+
+    commit_sha, java_files = list_java_files(session, args.api_url, args.owner, args.repo, args.branch, args.suffix, args.retries)
+    print(f"Using commit SHA: {commit_sha}")
+    print(f"Found {len(java_files)} Java files.")
+
+    raw_base = f"{args.raw_url}/{args.owner}/{args.repo}/{commit_sha}/"
+    done, failed, size = download_all(
+        session, raw_base, java_files, args.suffix, args.output, manifest, args.workers, args.retries, args.backoff
+    )
+    seconds = time.perf_counter() - start
+    print(f"Downloaded {done} files ({size / 1e6:.1f} MB) in {seconds:.1f}s to {args.output}, {failed} failed.")
+    if failed:
+        # The manifest has every file that made it; run again to fetch the rest
+        sys.exit(1)
+
 
-    with open(local_path, "w", encoding="utf-8") as f:
-        f.write(raw_content)
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,19 @@
-import ast
-import re
-import os
-import pandas as pd
 from tqdm import tqdm
 
-# Load YAML CSV
-df = pd.read_csv("data/yaml_summaries.csv")
-
-# Extract fields from summary
-def extract_summary_fields(summary_str):
-    try:
-        parsed = ast.literal_eval(summary_str)
-        if isinstance(parsed, list) and len(parsed) > 4:
-            arg_signature = parsed[4]
-            types_list = []
-            if arg_signature and arg_signature != "()":
-                types_list = [
-                    t.strip().split()[-1].split(".")[-1] for t in arg_signature.strip("()").split(",")
-                ]
-            return pd.Series({
-                "Model": parsed[0],
-                "Package": parsed[1],
-                "FunctionName": parsed[3],
-                "ArgCount": len(types_list),
-                "ParamTypes": types_list,
-                "Summary": parsed,
-                "SummaryStr": str(parsed)
-            })
-    except Exception:
-        return pd.Series({
-            "Model": None,
-            "Package": None,
-            "FunctionName": None,
-            "ArgCount": None,
-            "ParamTypes": None,
-            "Summary": summary_str,
-            "SummaryStr": summary_str
-        })
+from analysis_cache import AnalysisCache
+from corpus import drop_analyses, load_java_files
+from java_index import CallSiteIndex
+from result_writer import ResultWriter
+from summaries import load_summaries
 
-summary_fields = df["Summary"].apply(extract_summary_fields)
-df = pd.concat([df, summary_fields], axis=1)
+# Load YAML summaries (parsed once, cached)
+entries = load_summaries()
 
 # Prepare Java files
-java_files = []
-for root, _, files in os.walk("data/dubbo-metadata"):
-    for file in files:
-        if file.endswith(".java"):
-            path = os.path.join(root, file)
-            with open(path, "r", encoding="utf-8") as f:
-                code = f.read()
-            java_files.append({
-                "filename": os.path.relpath(path, "data"),  # updated
-                "lines": code.splitlines(),
-                "code": code
-            })
-
-method_pattern = re.compile(r"^\s*(public|private|protected)?\s+\w.*\)\s*\{")
-pattern_template = re.compile(r"(\b\w+)\.{}\s*\(")
+java_files = load_java_files("data/dubbo-metadata", cache=AnalysisCache())
+files_by_name = {f["filename"]: f for f in java_files}
+call_sites = CallSiteIndex.build(java_files, names={e.FunctionName for e in entries if e.FunctionName})
+drop_analyses(java_files)
 
 # Utility to check type matching
 def types_match(expected, actual):
@@ -68,10 +25,11 @@ def types_match(expected, actual):
 model_id_map = {}
 model_counter = 1
 match_counter = {}
-all_matches = []
+# Rows are streamed to the output as they are found
+writer = ResultWriter("matched_all_yml_with_flags.csv")
 
 # Match logic
-for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=1):
+for entry_id, entry in enumerate(tqdm(entries), start=1):
     # Assign model ID (a)
     model = entry.Model
     if model not in model_id_map:
@@ -84,42 +42,17 @@ for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=
 
     matched = False
 
-    for java_file in java_files:
+    for filename, sites in call_sites.by_file(entry.FunctionName):
+        java_file = files_by_name[filename]
         java_lines = java_file["lines"]
-        filename = java_file["filename"]
-
-        method_boundaries = []
-        brace_stack = []
-        inside_method = False
-        current_method = None
-
-        for i, line in enumerate(java_lines):
-            if not inside_method and method_pattern.match(line):
-                current_method = {"start": i, "signature": line.strip()}
-                inside_method = True
-                brace_stack = ["{"] if "{" in line else []
-            elif inside_method:
-                brace_stack.extend([b for b in line if b == "{"])
-                brace_stack = brace_stack[:len(brace_stack) - line.count("}")]
-                if not brace_stack:
-                    current_method["end"] = i
-                    current_method["body"] = "\n".join(java_lines[current_method["start"]:i+1])
-                    current_method["lines"] = java_lines[current_method["start"]:i+1]
-                    method_boundaries.append(current_method)
-                    inside_method = False
-
-        pattern = pattern_template.pattern.format(re.escape(entry.FunctionName))
-        regex = re.compile(pattern)
-
-        for line_idx, line in enumerate(java_lines, start=1):
-            match = regex.search(line)
-            if not match:
-                continue
-            caller_var = match.group(1)
-
-            arg_list_match = re.search(rf"{re.escape(entry.FunctionName)}\s*\((.*?)\)", line)
-            if arg_list_match:
-                args = [arg.strip() for arg in arg_list_match.group(1).split(",") if arg.strip()]
+
+        for site in sites:
+            line_idx = site.line_number
+            line = java_lines[line_idx - 1]
+            caller_var = site.receiver
+
+            if site.args is not None:
+                args = [arg.strip() for arg in site.args.split(",") if arg.strip()]
                 actual_arg_count = len(args)
                 actual_types = ["Any"] * actual_arg_count
             else:
@@ -129,23 +62,14 @@ for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=
             mother_function = ""
             start_line = end_line = None
             mother_body = ""
-            mother_lines = []
-            for method in method_boundaries:
-                if method["start"] <= line_idx - 1 <= method["end"]:
-                    mother_function = method["signature"]
-                    start_line = method["start"] + 1
-                    end_line = method["end"] + 1
-                    mother_body = method["body"]
-                    mother_lines = method["lines"]
-                    break
-
-            declared_type = None
-            declaration_pattern = re.compile(rf"\b(\w+)\s*<[^>]*>?\s+{re.escape(caller_var)}\b|\b(\w+)\s+{re.escape(caller_var)}\b")
-            for body_line in mother_lines:
-                decl_match = declaration_pattern.search(body_line)
-                if decl_match:
-                    declared_type = decl_match.group(1) or decl_match.group(2)
-                    break
+            method = java_file["methods"].enclosing(line_idx - 1)
+            if method:
+                mother_function = method["signature"]
+                start_line = method["start"] + 1
+                end_line = method["end"] + 1
+                mother_body = method["body"]
+
+            declared_type = java_file["symbols"].lookup(line_idx - 1, caller_var)
 
             expected_type = entry.Package.split(".")[-1]
             expected_params = entry.ParamTypes if isinstance(entry.ParamTypes, list) else []
@@ -154,7 +78,7 @@ for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=
                 match_counter[match_counter_key] += 1
                 match_id = match_counter[match_counter_key]  # c
                 unique_id = f"{entry.Model.replace('.', '-')}-model-{entry.Package.replace('.', '-')}-{entry.FunctionName}-{model_id}-{entry_id}-{match_id}"
-                all_matches.append({
+                writer.write({
                     "ID": unique_id,
                     "Matched": "T",
                     "Model": entry.Model,
@@ -174,7 +98,7 @@ for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=
         match_counter[match_counter_key] += 1
         match_id = match_counter[match_counter_key]
         unique_id = f"{entry.Model.replace('.', '-')}-model-{entry.Package.replace('.', '-')}-{entry.FunctionName}-{model_id}-{entry_id}-{match_id}"
-        all_matches.append({
+        writer.write({
             "ID": unique_id,
             "Matched": "F",
             "Model": entry.Model,
@@ -190,6 +114,5 @@ for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=
         })
 
 # Save output
-final_df = pd.DataFrame(all_matches)
-final_df.to_csv("matched_all_yml_with_flags.csv", index=False)
+writer.close()
 print("Full YAML entries with updated unique IDs saved to matched_all_yml_with_flags.csv")
@@ -0,0 +1,82 @@
+import json
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class Stats:
+    # Wall time and call count per stage, plus named counters (files, bytes
+    # read, candidates in/out, ...). One instance per process (stats below);
+    # worker processes send theirs back with pop() and the parent merges them.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        return {
+            "stages": {name: {"seconds": self.seconds[name], "calls": self.calls[name]} for name in self.seconds},
+            "counters": dict(self.counters)
+        }
+
+    def pop(self):
+        summary = self.summary()
+        self.reset()
+        return summary
+
+    def merge(self, summary):
+        for name, stage in summary["stages"].items():
+            self.add_time(name, stage["seconds"], stage["calls"])
+        for name, n in summary["counters"].items():
+            self.count(name, n)
+
+    def report(self):
+        lines = [f"{'stage':24} {'seconds':>10} {'calls':>10}"]
+        for name, seconds in self.seconds.items():
+            lines.append(f"{name:24} {seconds:10.3f} {self.calls[name]:10}")
+        lines.append("")
+        for name, n in self.counters.items():
+            lines.append(f"{name:24} {n:>21}")
+        return "\n".join(lines)
+
+
+stats = Stats()
+
+
+def write_profile(profiler, prefix, top=30):
+    # pstats dump (<prefix>.prof, for snakeviz/pstats) and a JSON summary with
+    # the stage stats and the functions with the most cumulative time
+    import io
+    import pstats
+
+    profiler.dump_stats(f"{prefix}.prof")
+    buffer = io.StringIO()
+    profile = pstats.Stats(profiler, stream=buffer).sort_stats("cumulative")
+    profile.print_stats(top)
+    functions = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in profile.stats.items():
+        functions.append({
+            "function": f"{filename}:{line}({function})", "calls": calls, "tottime": tottime, "cumtime": cumtime
+        })
+    functions.sort(key=lambda f: f["cumtime"], reverse=True)
+
+    with open(f"{prefix}.profile.json", "w") as f:
+        json.dump({**stats.summary(), "top_functions": functions[:top]}, f, indent=2)
+    return buffer.getvalue()
@@ -0,0 +1,392 @@
+import re
+from bisect import bisect_right
+from collections import namedtuple
+
+from instrumentation import stats
+from java_lexer import mask_source
+
+method_pattern = re.compile(r"^\s*(public|private|protected)?\s+\w.*\)\s*\{")
+
+
+# The lines with comments and string/char literal contents blanked, at the same
+# offsets. Every scan below reads these, so braces, calls and imports inside
+# comments or literals are not seen.
+def masked_lines(java_lines):
+    if hasattr(java_lines, "masked"):
+        return java_lines.masked()
+    return mask_source("\n".join(java_lines)).split("\n")
+
+
+# Find method boundaries (same brace-stack heuristic the matching scripts used inline)
+def find_method_ranges(java_lines):
+    ranges = []
+    current = None
+    depth = 0
+    for i, line in enumerate(masked_lines(java_lines)):
+        if current is None:
+            if method_pattern.match(line):
+                current = (i, java_lines[i].strip())
+                depth = 1 if "{" in line else 0
+        else:
+            depth += line.count("{")
+            # Same result as brace_stack[:len(brace_stack) - line.count("}")], negative slices included
+            depth = len(range(depth)[:depth - line.count("}")])
+            if not depth:
+                ranges.append((current[0], i, current[1]))
+                current = None
+    return ranges
+
+
+def method_record(java_lines, start, end, signature):
+    # body is the original text, comments and literals included
+    if hasattr(java_lines, "text"):
+        body = java_lines.text(start, end)
+    else:
+        body = "\n".join(java_lines[start:end + 1])
+    return {"start": start, "end": end, "signature": signature, "body": body}
+
+
+class MethodIndex:
+    # A method only starts once the previous one has closed, so the intervals are
+    # disjoint and sorted: one bisect on the start lines finds the enclosing method.
+    # Only (start, end, signature) is kept; body and lines are sliced on lookup.
+    def __init__(self, java_lines, ranges):
+        self.java_lines = java_lines
+        self.ranges = ranges
+        self.starts = [r[0] for r in ranges]
+
+    def __iter__(self):
+        return (method_record(self.java_lines, *r) for r in self.ranges)
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def enclosing(self, line_idx):
+        # line_idx is 0-based, like the "start"/"end" fields
+        pos = bisect_right(self.starts, line_idx) - 1
+        if pos >= 0 and line_idx <= self.ranges[pos][1]:
+            return method_record(self.java_lines, *self.ranges[pos])
+        return None
+
+    @classmethod
+    def from_lines(cls, java_lines):
+        return cls(java_lines, find_method_ranges(java_lines))
+
+
+call_site_pattern = re.compile(r"(\b\w+)\.(\w+)\s*\(")
+
+
+class NameScanner:
+    # Finds calls to every wanted method name in one pass over a file. A single
+    # generic receiver.name( regex plus a set lookup on the name is much faster in
+    # CPython than an alternation of thousands of names, and gives the same hits.
+    def __init__(self, names=None):
+        self.names = frozenset(names) if names is not None else None
+
+    def scan(self, java_lines):
+        names = self.names
+        for line_idx, line in enumerate(masked_lines(java_lines), start=1):
+            if "(" not in line:
+                continue
+            for match in call_site_pattern.finditer(line):
+                receiver, name = match.groups()
+                if names is None or name in names:
+                    yield line_idx, line, receiver, name
+
+
+arg_patterns = {}
+
+
+def find_call_sites(java_lines, names=None):
+    sites = []
+    for line_idx, line, receiver, name in NameScanner(names).scan(java_lines):
+        # Argument text, taken as the scripts did: the first "name(...)" on the
+        # line, up to the first closing parenthesis. The line is masked, so commas
+        # and parentheses inside literal arguments do not split or end it.
+        arg_pattern = arg_patterns.get(name)
+        if arg_pattern is None:
+            arg_pattern = arg_patterns[name] = re.compile(rf"{re.escape(name)}\s*\((.*?)\)")
+        arg_match = arg_pattern.search(line)
+        sites.append((line_idx, receiver, name, arg_match.group(1) if arg_match else None))
+    return sites
+
+
+CallSite = namedtuple("CallSite", ["filename", "line_number", "receiver", "args"])
+
+
+class CallSiteIndex:
+    # Every receiver.name( occurrence in the corpus (or only those for the names
+    # given to build), keyed by method name.
+    # Sites are kept in corpus order (file walk order, then line order), which is
+    # the order the per-entry scans used to find them in.
+    def __init__(self, sites, names=None):
+        self.sites = sites
+        # Method names the index was restricted to (None: every name in the corpus)
+        self.names = names
+
+    def lookup(self, name):
+        return self.sites.get(name, [])
+
+    def by_file(self, name):
+        # Group a name's sites per file, keeping only the first call on each line
+        # (the scripts used regex.search, so later calls on the same line were never seen)
+        grouped = []
+        last = None
+        for site in self.lookup(name):
+            if last is not None and (site.filename, site.line_number) == (last.filename, last.line_number):
+                continue
+            if not grouped or grouped[-1][0] != site.filename:
+                grouped.append((site.filename, []))
+            grouped[-1][1].append(site)
+            last = site
+        return grouped
+
+    @classmethod
+    def build(cls, java_files, names=None):
+        # Filters the per-file call sites found by analyze_file
+        names = frozenset(names) if names is not None else None
+        sites = {}
+        for java_file in java_files:
+            filename = java_file["filename"]
+            for line_idx, receiver, name, args in java_file["analysis"]["call_sites"]:
+                if names is None or name in names:
+                    sites.setdefault(name, []).append(CallSite(filename, line_idx, receiver, args))
+        return cls(sites, names)
+
+
+class ImportIndex:
+    # Corpus-wide import map, built once: simple class name and fully qualified
+    # name -> files importing it, plus wildcard imports and package declarations
+    # so same-package and "import pkg.*" visibility can be answered by lookup.
+    def __init__(self):
+        self.by_simple_name = {}
+        self.by_qualified_name = {}
+        self.by_wildcard = {}
+        self.by_package = {}
+
+    @classmethod
+    def build(cls, java_files):
+        index = cls()
+        for java_file in java_files:
+            analysis = java_file["analysis"]
+            index.add(java_file["filename"], analysis["package"], analysis["imports"])
+        return index
+
+    def add(self, filename, package, imports):
+        for pkg in imports:
+            # Same key the scripts tested with pkg.endswith("." + cls) or pkg == cls
+            self.by_simple_name.setdefault(pkg.rsplit(".", 1)[-1], set()).add(filename)
+            qualified = pkg.strip()
+            if qualified.startswith("static "):
+                qualified = qualified[len("static "):].strip()
+            if qualified.endswith(".*"):
+                self.by_wildcard.setdefault(qualified[:-2], set()).add(filename)
+            else:
+                self.by_qualified_name.setdefault(qualified, set()).add(filename)
+        if package is not None:
+            self.by_package.setdefault(package, set()).add(filename)
+
+    def candidates(self, package, class_name):
+        # Files that can refer to package.class_name by its simple name. A nested
+        # class (Outer$Inner) is also visible through an import of its outer class.
+        outer = class_name.split("$")[0]
+        files = set(self.by_simple_name.get(class_name.split(".")[-1], ()))
+        files.update(self.by_qualified_name.get(f"{package}.{outer}", ()))
+        files.update(self.by_wildcard.get(package, ()))
+        files.update(self.by_package.get(package, ()))
+        return files
+
+
+# Package declaration and import targets ("import " and ";" stripped, as the scripts did)
+def parse_imports(java_lines):
+    package = None
+    imports = []
+    for line in masked_lines(java_lines):
+        line = line.strip()
+        if line.startswith("import "):
+            imports.append(line[len("import "):].rstrip(";"))
+        elif line.startswith("package ") and package is None:
+            package = line[len("package "):].rstrip(";").strip()
+    return package, imports
+
+
+# Type arguments, innermost first; only type-like characters, so comparisons
+# such as "a < b && c > d" are left alone
+type_arguments_pattern = re.compile(r"<(?:[\w$\s,.?\[\]]|&(?!&))*>")
+
+declaration_scan_pattern = re.compile(r"""
+    (?P<open>\{) | (?P<close>\}) | (?P<paren_open>\() | (?P<paren_close>\)) | (?P<semicolon>;)
+  | (?P<type_decl>\b(?:class|interface|enum|record)\s+[A-Za-z_$][\w$]*)
+  | (?<![\w$.])(?P<type>[A-Za-z_$][\w$]*(?:\s*\.\s*[A-Za-z_$][\w$]*)*)
+    (?P<dims>(?:\s*\[\s*\])*)(?P<varargs>\s*\.\.\.)?
+    \s+(?P<name>[A-Za-z_$][\w$]*)(?=\s*[=;,):\[])
+""", re.VERBOSE)
+
+var_initializer_pattern = re.compile(r"\s*=\s*new\s+([A-Za-z_$][\w$]*(?:\s*\.\s*[A-Za-z_$][\w$]*)*)")
+
+# Words that can stand before an identifier without declaring it
+non_type_words = frozenset({
+    "return", "new", "throw", "else", "case", "yield", "assert", "package", "import", "instanceof",
+    "extends", "implements", "throws", "permits", "super", "this", "default", "goto", "do", "break",
+    "continue", "public", "private", "protected", "static", "final", "abstract", "synchronized",
+    "transient", "volatile", "native", "strictfp", "sealed"
+})
+
+
+def blank_type_arguments(code):
+    # Generics replaced by spaces (nested ones too), keeping offsets
+    while True:
+        blanked = type_arguments_pattern.sub(lambda m: " " * len(m.group()), code)
+        if blanked == code:
+            return code
+        code = blanked
+
+
+def declared_type_name(match, code):
+    type_name = re.sub(r"\s+", "", match.group("type"))
+    if type_name == "var":
+        initializer = var_initializer_pattern.match(code, match.end())
+        if not initializer:
+            return None
+        type_name = re.sub(r"\s+", "", initializer.group(1))
+    dims = match.group("dims").count("[") + (1 if match.group("varargs") else 0)
+    return type_name.split(".")[-1] + "[]" * dims
+
+
+# Declared types of parameters, locals and fields, from one scan of the masked
+# file with generics blanked. Types are simple names ("java.util.List<String>"
+# becomes "List"), with "[]" per array dimension; "var" takes the type after
+# "= new". Parameters and locals go to the method range whose body holds them,
+# fields to the class whose body declares them. Where a name is declared more
+# than once, the first declaration is kept.
+def find_declarations(java_lines, ranges):
+    lines = list(masked_lines(java_lines))
+    code = blank_type_arguments("\n".join(lines))
+    line_starts = []
+    pos = 0
+    for line in lines:
+        line_starts.append(pos)
+        pos += len(line) + 1
+
+    def line_of(offset):
+        return bisect_right(line_starts, offset) - 1
+
+    def method_at(line_idx):
+        pos = bisect_right(starts, line_idx) - 1
+        return pos if pos >= 0 and line_idx <= ranges[pos][1] else None
+
+    starts = [r[0] for r in ranges]
+    methods = [{} for _ in ranges]
+    classes = []
+    # One entry per open brace: (index into classes for a class body else None,
+    # paren depth outside the brace)
+    scopes = []
+    pending_class = False
+    # Parameters seen in a class body, waiting for the method body that takes them
+    pending_params = []
+    paren_depth = 0
+
+    for match in declaration_scan_pattern.finditer(code):
+        kind = match.lastgroup
+        in_class_body = bool(scopes) and scopes[-1][0] is not None
+        if kind == "open":
+            if pending_class:
+                classes.append([line_of(match.start()), len(lines) - 1, {}])
+                scopes.append((len(classes) - 1, paren_depth))
+            else:
+                if in_class_body and pending_params:
+                    pos = method_at(line_of(match.start()))
+                    if pos is not None:
+                        for name, type_name in pending_params:
+                            methods[pos].setdefault(name, type_name)
+                scopes.append((None, paren_depth))
+            pending_class = False
+            pending_params = []
+            paren_depth = 0
+        elif kind == "close":
+            if scopes:
+                class_pos, paren_depth = scopes.pop()
+                if class_pos is not None:
+                    classes[class_pos][1] = line_of(match.start())
+        elif kind == "paren_open":
+            paren_depth += 1
+        elif kind == "paren_close":
+            paren_depth = max(paren_depth - 1, 0)
+        elif kind == "semicolon":
+            if paren_depth == 0:
+                pending_params = []
+        elif kind == "type_decl":
+            pending_class = True
+            pending_params = []
+        else:
+            name = match.group("name")
+            if match.group("type") in non_type_words or name in non_type_words:
+                continue
+            type_name = declared_type_name(match, code)
+            if type_name is None:
+                continue
+            if in_class_body:
+                if paren_depth:
+                    pending_params.append((name, type_name))
+                else:
+                    classes[scopes[-1][0]][2].setdefault(name, type_name)
+            else:
+                pos = method_at(line_of(match.start()))
+                if pos is not None:
+                    methods[pos].setdefault(name, type_name)
+
+    return {"methods": methods, "classes": [tuple(c) for c in classes]}
+
+
+class SymbolTable:
+    # Declared type of a name as seen from a line: the enclosing method's
+    # parameters and locals first, then the fields of the enclosing classes,
+    # innermost first. One bisect plus dict lookups, built from find_declarations.
+    def __init__(self, ranges, declarations):
+        self.starts = [r[0] for r in ranges]
+        self.ends = [r[1] for r in ranges]
+        self.methods = declarations["methods"]
+        self.classes = declarations["classes"]
+
+    def method_symbols(self, line_idx):
+        pos = bisect_right(self.starts, line_idx) - 1
+        if pos >= 0 and line_idx <= self.ends[pos]:
+            return self.methods[pos]
+        return {}
+
+    def lookup(self, line_idx, name):
+        # line_idx is 0-based, like MethodIndex.enclosing
+        declared_type = self.method_symbols(line_idx).get(name)
+        if declared_type is not None:
+            return declared_type
+        for start, end, fields in reversed(self.classes):
+            if start <= line_idx <= end and name in fields:
+                return fields[name]
+        return None
+
+
+# Bump when any heuristic below changes, so cached analyses are recomputed
+ANALYSIS_VERSION = 4
+
+
+# Everything the matchers derive from one file; depends only on its content
+def analyze_file(java_lines):
+    with stats.stage("masking"):
+        masked_lines(java_lines)
+    with stats.stage("import_parsing"):
+        package, imports = parse_imports(java_lines)
+    with stats.stage("boundary_extraction"):
+        methods = find_method_ranges(java_lines)
+    with stats.stage("call_site_scanning"):
+        call_sites = find_call_sites(java_lines)
+    with stats.stage("declaration_scanning"):
+        declarations = find_declarations(java_lines, methods)
+    stats.count("methods_found", len(methods))
+    stats.count("call_sites_found", len(call_sites))
+    return {
+        "methods": methods,
+        "package": package,
+        "imports": imports,
+        "call_sites": call_sites,
+        "declarations": declarations
+    }
@@ -0,0 +1,42 @@
+import re
+
+# Comments and string/char literals, found in one left-to-right pass, so a quote
+# inside a comment or a "//" inside a string is never taken for the other.
+# The named group of each alternative is the part that gets blanked: the whole
+# comment, or the contents of a literal (its quotes are kept, so an empty string
+# argument still reads as an argument).
+literal_pattern = re.compile(r'''
+    (?P<comment>//[^\r\n]*|/\*[\s\S]*?(?:\*/|\Z))
+  | """(?P<text_block>[\s\S]*?)(?:"""|\Z)
+  | "(?P<string>(?:\\.|[^"\\\r\n])*)"?
+  | '(?P<char>(?:\\.|[^'\\\r\n])*)'?
+''', re.VERBOSE)
+
+# Anything but the separators str.splitlines() splits on
+blank_pattern = re.compile(r"[^\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+def blank(text):
+    return blank_pattern.sub(" ", text)
+
+
+# A copy of the source with comments and literal contents replaced by spaces.
+# Offsets and line breaks are unchanged, so a position or line number in the
+# masked copy is the same position or line in the original.
+def mask_source(code):
+    if "/" not in code and '"' not in code and "'" not in code:
+        return code
+    pieces = []
+    pos = 0
+    for match in literal_pattern.finditer(code):
+        start, end = match.span(match.lastgroup)
+        if start == end:
+            continue
+        pieces.append(code[pos:start])
+        pieces.append(blank(code[start:end]))
+        pos = end
+    if not pieces:
+        return code
+    pieces.append(code[pos:])
+    return "".join(pieces)
+
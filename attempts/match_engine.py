@@ -0,0 +1,299 @@
+import os
+import random
+from collections import namedtuple
+from itertools import islice
+from time import perf_counter
+
+from analysis_cache import AnalysisCache
+from corpus import drop_analyses, load_corpus
+from instrumentation import stats
+from java_index import CallSiteIndex, ImportIndex
+from parser_backends import get_backend
+from summaries import load_summaries
+
+# One call site that matches an entry, with what the output rows need from it
+Match = namedtuple("Match", ["filename", "line_number", "line", "mother_line", "mother_body", "declared_type"])
+
+# The output variants one scan can write; see entry_outputs
+OUTPUTS = ["full", "top", "filtered", "unmatched"]
+
+# What one scan produces: the outputs to build, top_n for "top", max_span for
+# "filtered", and sample_seed to sample top rows instead of taking the first ones
+MatchOptions = namedtuple("MatchOptions", ["outputs", "top_n", "max_span", "import_filter", "sample_seed"],
+                          defaults=(("full",), 10, 1000, True, None))
+
+def types_match(expected, actual):
+    if len(expected) != len(actual):
+        return False
+    return all(e == "Any" or a == "Any" or e.lower() == a.lower() for e, a in zip(expected, actual))
+
+# Summaries, corpus and indexes, loaded once per process. Forked workers inherit
+# the parent's copy; spawned workers load their own through the pool initializer.
+state = {}
+
+def build_state(entries, java_files):
+    # Model IDs are numbered by first appearance, so they are fixed before any sharding
+    model_id_map = {}
+    model_ids = []
+    for model in (e.Model for e in entries):
+        if model not in model_id_map:
+            model_id_map[model] = len(model_id_map) + 1
+        model_ids.append(model_id_map[model])
+
+    with stats.stage("build_indexes"):
+        state.update({
+            "entries": entries,
+            "model_ids": model_ids,
+            "files_by_name": {f["filename"]: f for f in java_files},
+            "call_sites": CallSiteIndex.build(java_files, names={e.FunctionName for e in entries if e.FunctionName}),
+            "imports": ImportIndex.build(java_files)
+        })
+        drop_analyses(java_files)
+
+def load_state(java_root="data", backend="regex", relative_to="data", summaries_path="data/yaml_summaries.csv"):
+    if state:
+        return
+    with stats.stage("load_summaries"):
+        entries = load_summaries(summaries_path)
+
+    # Prepare Java files (java_root is a directory or a corpus pack)
+    java_files = load_corpus(java_root, relative_to=relative_to, cache=AnalysisCache(), backend=get_backend(backend))
+    build_state(entries, java_files)
+
+def init_worker(*load_args):
+    load_state(*load_args)
+    # Loading is counted once, by the parent
+    stats.reset()
+
+# Every call site matching the entry, in corpus order, as (filename, line number,
+# declared type, java file). With import_filter, only files that can see the YAML
+# class (import, wildcard import or same package). Lazy, so a caller that has
+# enough can stop early.
+def iter_matching_sites(entry, import_filter=True):
+    files_by_name = state["files_by_name"]
+    call_sites = state["call_sites"]
+    imports = state["imports"]
+
+    expected_type = entry.Package.split(".")[-1]
+    expected_params = entry.ParamTypes if isinstance(entry.ParamTypes, list) else []
+
+    candidate_files = None
+    if import_filter:
+        with stats.stage("import_filter"):
+            candidate_files = imports.candidates(entry.Model, entry.Package)
+    resolution_seconds = 0.0
+    try:
+        for filename, sites in call_sites.by_file(entry.FunctionName):
+            stats.count("candidate_files_in")
+            if candidate_files is not None and filename not in candidate_files:
+                continue
+            stats.count("candidate_files_out")
+            java_file = files_by_name[filename]
+
+            for site in sites:
+                stats.count("sites_examined")
+                line_idx = site.line_number
+
+                if site.args is not None:
+                    args = [arg.strip() for arg in site.args.split(",") if arg.strip()]
+                    actual_arg_count = len(args)
+                    actual_types = ["Any"] * actual_arg_count
+                else:
+                    actual_arg_count = 0
+                    actual_types = []
+
+                # Timed inline: this runs once per call site
+                start = perf_counter()
+                declared_type = java_file["symbols"].lookup(line_idx - 1, site.receiver)
+                resolution_seconds += perf_counter() - start
+                stats.count("types_resolved" if declared_type else "types_unresolved")
+
+                if declared_type == expected_type and actual_arg_count == entry.ArgCount and types_match(expected_params, actual_types):
+                    yield filename, line_idx, declared_type, java_file
+    finally:
+        if resolution_seconds:
+            stats.add_time("type_resolution", resolution_seconds)
+
+def to_match(filename, line_idx, declared_type, java_file):
+    start_line = end_line = None
+    mother_body = ""
+    method = java_file["methods"].enclosing(line_idx - 1)
+    if method:
+        start_line = method["start"] + 1
+        end_line = method["end"] + 1
+        mother_body = method["body"]
+    return Match(filename, line_idx, java_file["lines"][line_idx - 1], (start_line, end_line), mother_body, declared_type)
+
+# The subproject a match is in: the first directory of its file name (data/<name>/...)
+def subproject(item):
+    return item[0].split(os.sep, 1)[0]
+
+def stratified_sample(items, n, rng, stratum_of=subproject):
+    # One pass, holding at most n items per stratum: a reservoir sample
+    # (Algorithm R) per subproject, then n items taken from the reservoirs in
+    # turn, so every subproject with matches is represented before any one of
+    # them gets a second pick. The result is in corpus order.
+    reservoirs = {}
+    seen = {}
+    for position, item in enumerate(items):
+        key = stratum_of(item)
+        reservoir = reservoirs.setdefault(key, [])
+        seen[key] = seen.get(key, 0) + 1
+        if len(reservoir) < n:
+            reservoir.append((position, item))
+        else:
+            slot = rng.randrange(seen[key])
+            if slot < n:
+                reservoir[slot] = (position, item)
+
+    strata = [reservoirs[key] for key in sorted(reservoirs)]
+    for reservoir in strata:
+        rng.shuffle(reservoir)
+    chosen = []
+    while len(chosen) < n and any(strata):
+        for reservoir in strata:
+            if reservoir and len(chosen) < n:
+                chosen.append(reservoir.pop())
+    return [item for _, item in sorted(chosen, key=lambda c: c[0])]
+
+def sample_rng(seed, entry_id):
+    # Seeded per entry, so a sample does not depend on sharding or on which other entries run
+    return random.Random(f"{seed}:{entry_id}")
+
+# Entries that match exactly the same call sites: the matching depends only on
+# the class (model and package, for the import filter and the declared type),
+# the method name and the argument counts, not on the taint input/output
+def call_signature(entry):
+    param_count = len(entry.ParamTypes) if isinstance(entry.ParamTypes, list) else 0
+    return entry.Model, entry.Package, entry.FunctionName, entry.ArgCount, param_count
+
+def needs_all_matches(options):
+    return "full" in options.outputs or "filtered" in options.outputs
+
+# One search for a call signature, shared by every entry with it: all matches,
+# all matching sites (to sample from, per entry), or the first ones the top and
+# unmatched outputs need (the search stops there)
+def search(entry, options):
+    stats.count("searches")
+    sites = iter_matching_sites(entry, options.import_filter)
+    try:
+        if needs_all_matches(options):
+            return [to_match(*site) for site in sites]
+        if options.sample_seed is not None:
+            return list(sites)
+        limit = options.top_n if "top" in options.outputs else 1
+        return [to_match(*site) for site in islice(sites, limit)]
+    finally:
+        sites.close()
+
+# Output rows for one entry: a T row per match, numbered from 1, or a single F row
+def entry_rows(entry_id, entry, model_id, matches):
+    id_prefix = f"{entry.Model.replace('.', '-')}-model-{entry.Package.replace('.', '-')}-{entry.FunctionName}-{model_id}-{entry_id}"
+    row = {
+        "ID": "",
+        "Matched": "F",
+        "Model": entry.Model,
+        "Package": entry.Package,
+        "FunctionName": entry.FunctionName,
+        "Summary": entry.SummaryStr,
+        "File": "",
+        "LineNumber": "",
+        "LineContent": "",
+        "MotherLine": "",
+        "MotherBody": "",
+        "DeclaredType": ""
+    }
+    if not matches:
+        return [{**row, "ID": f"{id_prefix}-1"}]
+
+    rows = []
+    for match_id, match in enumerate(matches, start=1):
+        rows.append({
+            **row,
+            "ID": f"{id_prefix}-{match_id}",
+            "Matched": "T",
+            "File": match.filename,
+            "LineNumber": match.line_number,
+            "LineContent": match.line.strip(),
+            "MotherLine": match.mother_line,
+            "MotherBody": match.mother_body,
+            "DeclaredType": match.declared_type
+        })
+    return rows
+
+# Same rule as tools/cleanup_the_long.py: the first match of an entry whose
+# enclosing method spans more than max_span lines
+def is_long_first_match(row, max_span=1000):
+    mother_line = row["MotherLine"]
+    if not isinstance(mother_line, tuple) or None in mother_line:
+        return False
+    start_line, end_line = mother_line
+    return end_line - start_line > max_span and row["ID"].split("-")[-1] == "1"
+
+# The rows of one entry for each output variant in options.outputs:
+#   full      every match (or the F row)
+#   top       top_n matches: the first ones, or a stratified sample with sample_seed
+#   filtered  full, without long-method first matches (tools/cleanup_the_long.py)
+#   unmatched the F row of an entry nothing matched
+# Without full or filtered, the search stops once top needs no more matches.
+# searches holds the results of search() by call signature, for reuse by the
+# next entries with the same signature.
+def entry_outputs(entry_id, entry, model_id, options, searches=None):
+    outputs = options.outputs
+    unknown = set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"unknown outputs {sorted(unknown)}, expected some of {OUTPUTS}")
+    if searches is None:
+        searches = {}
+    signature = call_signature(entry)
+    found = searches.get(signature)
+    if found is None:
+        found = searches[signature] = search(entry, options)
+    else:
+        stats.count("searches_shared")
+
+    sample = None
+    if options.sample_seed is not None:
+        sample = (options.top_n, sample_rng(options.sample_seed, entry_id))
+    if needs_all_matches(options):
+        matches = found
+        top = stratified_sample(matches, *sample) if sample is not None else matches[:options.top_n]
+    elif sample is not None:
+        matches = top = [to_match(*site) for site in stratified_sample(found, *sample)]
+    else:
+        matches = top = found[:options.top_n]
+    stats.count("entries_matched" if matches else "entries_unmatched")
+    stats.count("matches", len(matches))
+
+    rows = {}
+    if "full" in outputs or "filtered" in outputs:
+        full_rows = entry_rows(entry_id, entry, model_id, matches)
+        if "full" in outputs:
+            rows["full"] = full_rows
+        if "filtered" in outputs:
+            rows["filtered"] = [row for row in full_rows if not is_long_first_match(row, options.max_span)]
+    if "top" in outputs:
+        rows["top"] = entry_rows(entry_id, entry, model_id, top)
+    if "unmatched" in outputs:
+        rows["unmatched"] = [] if matches else entry_rows(entry_id, entry, model_id, matches)
+    return rows
+
+# Output rows of the entries with IDs in [start, stop), one dict per entry. Rows
+# sharing a call signature mostly sit next to each other in the summaries, so one
+# search per signature per shard covers nearly all of the reuse.
+def match_shard(shard, options=MatchOptions()):
+    start, stop = shard
+    shard_rows = []
+    searches = {}
+    with stats.stage("match"):
+        for entry_id, entry in enumerate(state["entries"][start - 1:stop - 1], start=start):
+            shard_rows.append(entry_outputs(entry_id, entry, state["model_ids"][entry_id - 1], options, searches))
+    return stop - start, shard_rows
+
+# Worker side: the shard's rows plus the stats it gathered, for the parent to merge
+def match_shard_with_stats(shard, options=MatchOptions()):
+    done, shard_rows = match_shard(shard, options)
+    return done, shard_rows, stats.pop()
+
+def shards_of(total, shard_size):
+    return [(start, min(start + shard_size, total + 1)) for start in range(1, total + 1, shard_size)]
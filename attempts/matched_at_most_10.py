@@ -1,202 +1,86 @@
-import ast
-import re
+import argparse
+import cProfile
 import os
-import pandas as pd
-from tqdm import tqdm
-
-# Load YAML CSV
-df = pd.read_csv("data/yaml_summaries.csv")
-
-# Extract fields from summary
-def extract_summary_fields(summary_str):
-    try:
-        parsed = ast.literal_eval(summary_str)
-        if isinstance(parsed, list) and len(parsed) > 4:
-            arg_signature = parsed[4]
-            types_list = []
-            if arg_signature and arg_signature != "()":
-                types_list = [
-                    t.strip().split()[-1].split(".")[-1] for t in arg_signature.strip("()").split(",")
-                ]
-            return pd.Series({
-                "Model": parsed[0],
-                "Package": parsed[1],
-                "FunctionName": parsed[3],
-                "ArgCount": len(types_list),
-                "ParamTypes": types_list,
-                "Summary": parsed,
-                "SummaryStr": str(parsed)
-            })
-    except Exception:
-        return pd.Series({
-            "Model": None,
-            "Package": None,
-            "FunctionName": None,
-            "ArgCount": None,
-            "ParamTypes": None,
-            "Summary": summary_str,
-            "SummaryStr": summary_str
-        })
-
-summary_fields = df["Summary"].apply(extract_summary_fields)
-df = pd.concat([df, summary_fields], axis=1)
-
-# Prepare Java files
-java_files = []
-for root, _, files in os.walk("data"):
-    for file in files:
-        if file.endswith(".java"):
-            path = os.path.join(root, file)
-            with open(path, "r", encoding="utf-8") as f:
-                code = f.read()
-            java_files.append({
-                "filename": os.path.relpath(path, "data"),
-                "lines": code.splitlines(),
-                "code": code
-            })
-
-method_pattern = re.compile(r"^\s*(public|private|protected)?\s+\w.*\)\s*\{")
-pattern_template = re.compile(r"(\b\w+)\.{}\s*\(")
-
-def types_match(expected, actual):
-    if len(expected) != len(actual):
-        return False
-    return all(e == "Any" or a == "Any" or e.lower() == a.lower() for e, a in zip(expected, actual))
-
-model_id_map = {}
-model_counter = 1
-match_counter = {}
-all_matches = []
-
-for entry_id, (_, entry) in enumerate(tqdm(df.iterrows(), total=len(df)), start=1):
-    model = entry.Model
-    if model not in model_id_map:
-        model_id_map[model] = model_counter
-        model_counter += 1
-    model_id = model_id_map[model]
-
-    match_counter_key = f"{entry.Model}-{entry.Package}-{entry.FunctionName}-{str(entry.ParamTypes)}-{entry_id}"
-    match_counter[match_counter_key] = 0
-
-    matched = False
-
-    for java_file in java_files:
-        java_lines = java_file["lines"]
-        filename = java_file["filename"]
+from functools import partial
+from multiprocessing import Pool
 
-        import_lines = [line.strip() for line in java_lines if line.strip().startswith("import ")]
-        imported_packages = [line[len("import "):].rstrip(";") for line in import_lines]
-
-        expected_class = entry.Package.split(".")[-1]
-        if not any(pkg.endswith(f".{expected_class}") or pkg == expected_class for pkg in imported_packages):
-            continue
-
-        method_boundaries = []
-        brace_stack = []
-        inside_method = False
-        current_method = None
-
-        for i, line in enumerate(java_lines):
-            if not inside_method and method_pattern.match(line):
-                current_method = {"start": i, "signature": line.strip()}
-                inside_method = True
-                brace_stack = ["{"] if "{" in line else []
-            elif inside_method:
-                brace_stack.extend([b for b in line if b == "{"])
-                brace_stack = brace_stack[:len(brace_stack) - line.count("}")]
-                if not brace_stack:
-                    current_method["end"] = i
-                    current_method["body"] = "\n".join(java_lines[current_method["start"]:i+1])
-                    current_method["lines"] = java_lines[current_method["start"]:i+1]
-                    method_boundaries.append(current_method)
-                    inside_method = False
-
-        pattern = pattern_template.pattern.format(re.escape(entry.FunctionName))
-        regex = re.compile(pattern)
-
-        for line_idx, line in enumerate(java_lines, start=1):
-            match = regex.search(line)
-            if not match:
-                continue
-            caller_var = match.group(1)
-
-            arg_list_match = re.search(rf"{re.escape(entry.FunctionName)}\s*\((.*?)\)", line)
-            if arg_list_match:
-                args = [arg.strip() for arg in arg_list_match.group(1).split(",") if arg.strip()]
-                actual_arg_count = len(args)
-                actual_types = ["Any"] * actual_arg_count
-            else:
-                actual_arg_count = 0
-                actual_types = []
-
-            mother_function = ""
-            start_line = end_line = None
-            mother_body = ""
-            mother_lines = []
-            for method in method_boundaries:
-                if method["start"] <= line_idx - 1 <= method["end"]:
-                    mother_function = method["signature"]
-                    start_line = method["start"] + 1
-                    end_line = method["end"] + 1
-                    mother_body = method["body"]
-                    mother_lines = method["lines"]
-                    break
-
-            declared_type = None
-            declaration_pattern = re.compile(rf"\b(\w+)\s*<[^>]*>?\s+{re.escape(caller_var)}\b|\b(\w+)\s+{re.escape(caller_var)}\b")
-            for body_line in mother_lines:
-                decl_match = declaration_pattern.search(body_line)
-                if decl_match:
-                    declared_type = decl_match.group(1) or decl_match.group(2)
-                    break
-
-            expected_type = entry.Package.split(".")[-1]
-            expected_params = entry.ParamTypes if isinstance(entry.ParamTypes, list) else []
-
-            if declared_type == expected_type and actual_arg_count == entry.ArgCount and types_match(expected_params, actual_types):
-                match_counter[match_counter_key] += 1
-                match_id = match_counter[match_counter_key]
-                if match_id > 10:
-                    continue
-                unique_id = f"{entry.Model.replace('.', '-')}-model-{entry.Package.replace('.', '-')}-{entry.FunctionName}-{model_id}-{entry_id}-{match_id}"
-                all_matches.append({
-                    "ID": unique_id,
-                    "Matched": "T",
-                    "Model": entry.Model,
-                    "Package": entry.Package,
-                    "FunctionName": entry.FunctionName,
-                    "Summary": entry.SummaryStr,
-                    "File": filename,
-                    "LineNumber": line_idx,
-                    "LineContent": line.strip(),
-                    "MotherLine": (start_line, end_line),
-                    "MotherBody": mother_body,
-                    "DeclaredType": declared_type
-                })
-                matched = True
-
-    if not matched:
-        match_counter[match_counter_key] += 1
-        match_id = match_counter[match_counter_key]
-        if match_id > 10:
-            continue
-        unique_id = f"{entry.Model.replace('.', '-')}-model-{entry.Package.replace('.', '-')}-{entry.FunctionName}-{model_id}-{entry_id}-{match_id}"
-        all_matches.append({
-            "ID": unique_id,
-            "Matched": "F",
-            "Model": entry.Model,
-            "Package": entry.Package,
-            "FunctionName": entry.FunctionName,
-            "Summary": entry.SummaryStr,
-            "File": "",
-            "LineNumber": "",
-            "LineContent": "",
-            "MotherLine": "",
-            "MotherBody": "",
-            "DeclaredType": ""
-        })
+from tqdm import tqdm
 
-# Save output
-final_df = pd.DataFrame(all_matches)
-final_df.to_csv("matched_at_most_10.csv", index=False)
-print("Full YAML entries with updated unique IDs saved to matched_at_most_10.csv")
+from columnar_results import ColumnarResultWriter
+from instrumentation import stats, write_profile
+from match_engine import (MatchOptions, entry_outputs, init_worker, load_state, match_shard, match_shard_with_stats,
+                          shards_of, state)
+from parser_backends import BACKENDS
+from result_writer import ResultWriter
+
+# The shared matching engine (match_engine) with only its "top" output: at most
+# 10 rows per entry, and the search for an entry stops at the 10th match.
+# yaml2code.py writes this and the other variants in one scan.
+OPTIONS = MatchOptions(outputs=("top",), top_n=10)
+
+def match_entry(entry_id, entry, model_id, options=OPTIONS):
+    return entry_outputs(entry_id, entry, model_id, options)["top"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Match YAML summaries against the Java corpus (at most 10 matches per entry)")
+    parser.add_argument("--root", default="data", help="corpus directory, or a pack written by yaml2code.py pack")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--shard-size", type=int, default=50, help="entries per work unit")
+    parser.add_argument("--output", default="matched_at_most_10.csv")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows buffered before each write")
+    parser.add_argument("--format", choices=["csv", "parquet", "feather"], default="csv",
+                        help="parquet/feather write <output>.matches.* and <output>.methods.* (needs pyarrow)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="regex",
+                        help="how Java files are analyzed (tree-sitter/javalang need their library installed)")
+    parser.add_argument("--sample-seed", type=int, default=None,
+                        help="sample the 10 matches per entry, spread across subprojects, instead of taking the first 10")
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile; write <output>.prof and <output>.profile.json (stage times and counters)")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    run(args)
+    if profiler:
+        profiler.disable()
+        prefix = os.path.splitext(args.output)[0]
+        print(write_profile(profiler, prefix))
+        print(stats.report())
+        print(f"Profile saved to {prefix}.prof and {prefix}.profile.json")
+
+def run(args):
+    load_state(args.root, args.backend)
+    total = len(state["entries"])
+    shards = shards_of(total, args.shard_size)
+    options = OPTIONS._replace(sample_seed=args.sample_seed)
+
+    # Shards come back in submission order, so rows and IDs are the same as a serial run.
+    # Rows are streamed to the output as each shard finishes.
+    if args.format == "csv":
+        writer = ResultWriter(args.output, batch_size=args.batch_size)
+        output = args.output
+    else:
+        prefix = os.path.splitext(args.output)[0]
+        writer = ColumnarResultWriter(prefix, args.format, batch_size=args.batch_size)
+        output = f"{writer.match_path} and {writer.method_path}"
+    with writer, tqdm(total=total) as progress:
+        if args.workers > 1:
+            # Workers are not under the profiler; their stage stats are merged here
+            with Pool(args.workers, initializer=init_worker, initargs=(args.root, args.backend)) as pool:
+                for done, shard_rows, shard_stats in pool.imap(partial(match_shard_with_stats, options=options), shards):
+                    stats.merge(shard_stats)
+                    for rows in shard_rows:
+                        writer.write_rows(rows["top"])
+                    progress.update(done)
+        else:
+            for shard in shards:
+                done, shard_rows = match_shard(shard, options)
+                for rows in shard_rows:
+                    writer.write_rows(rows["top"])
+                progress.update(done)
+
+    print(f"Full YAML entries with updated unique IDs saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+import re
+from bisect import bisect_right
+
+from instrumentation import stats
+from java_index import analyze_file, blank_type_arguments, parse_imports
+from java_lexer import mask_source
+
+try:
+    import javalang
+except ImportError:
+    javalang = None
+
+try:
+    import tree_sitter
+    import tree_sitter_java
+except ImportError:
+    tree_sitter = None
+
+
+# A backend turns the lines of one file into the analysis dict analyze_file
+# returns: method ranges, package and imports, call sites and declarations.
+# The regex backend is the default; the parser backends are used when their
+# library is installed, and fill in the same fields from a real syntax tree.
+class RegexBackend:
+    name = "regex"
+
+    def __init__(self):
+        self.fallbacks = 0
+
+    def analyze(self, java_lines):
+        return analyze_file(java_lines)
+
+
+def simple_type_name(type_text):
+    # Same form find_declarations records: generics stripped, last name segment,
+    # "[]" per array dimension or varargs
+    text = re.sub(r"\s+", "", blank_type_arguments(type_text))
+    dims = text.count("[") + text.count("...")
+    text = text.replace("[]", "").replace("...", "")
+    return text.split(".")[-1] + "[]" * dims
+
+
+def outermost(ranges):
+    # MethodIndex needs disjoint, sorted ranges; methods of local or anonymous
+    # classes are folded into the method that contains them, as the regex path does
+    kept = []
+    for method_range in sorted(ranges):
+        if not kept or method_range[0] > kept[-1][1]:
+            kept.append(method_range)
+    return kept
+
+
+def range_at(ranges, starts, line_idx):
+    pos = bisect_right(starts, line_idx) - 1
+    return pos if pos >= 0 and line_idx <= ranges[pos][1] else None
+
+
+def build_analysis(java_lines, method_ranges, method_declarations, classes, call_sites):
+    # method_ranges: (header start, body end, row of the body's "{"); the
+    # signature is the whole header, its lines stripped and joined by spaces.
+    # method_declarations: (order, line_idx, name, type) for parameters and
+    # locals; they go to the kept method range holding line_idx, in source order
+    ranges = outermost(method_ranges)
+    starts = [r[0] for r in ranges]
+    methods = [{} for _ in ranges]
+    for _, line_idx, name, type_name in sorted(method_declarations):
+        pos = range_at(ranges, starts, line_idx)
+        if pos is not None:
+            methods[pos].setdefault(name, type_name)
+    package, imports = parse_imports(java_lines)
+    return {
+        "methods": [
+            (start, end, " ".join(line.strip() for line in java_lines[start:brace_row + 1]))
+            for start, end, brace_row in ranges
+        ],
+        "package": package,
+        "imports": imports,
+        "call_sites": [site[:1] + site[2:] for site in sorted(call_sites)],
+        "declarations": {"methods": methods, "classes": sorted((tuple(c) for c in classes), key=lambda c: c[0])}
+    }
+
+
+class ParserBackend:
+    # Shared by the parser backends: a file the parser rejects is analyzed by
+    # the regex backend instead, and counted in fallbacks
+    name = None
+
+    def __init__(self):
+        self.fallbacks = 0
+
+    def analyze(self, java_lines):
+        try:
+            with stats.stage("parsing"):
+                return self.parse(list(java_lines))
+        except Exception:
+            self.fallbacks += 1
+            stats.count("parser_fallbacks")
+            return analyze_file(java_lines)
+
+
+class TreeSitterBackend(ParserBackend):
+    name = "tree-sitter"
+
+    method_types = frozenset({"method_declaration", "constructor_declaration", "compact_constructor_declaration"})
+    class_types = frozenset({
+        "class_declaration", "interface_declaration", "enum_declaration", "record_declaration",
+        "annotation_type_declaration"
+    })
+    local_types = frozenset({
+        "local_variable_declaration", "enhanced_for_statement", "catch_formal_parameter", "resource"
+    })
+    field_types = frozenset({"field_declaration", "constant_declaration"})
+    parameter_types = frozenset({"formal_parameter", "spread_parameter"})
+    receiver_types = frozenset({"identifier", "this", "super"})
+
+    def __init__(self):
+        super().__init__()
+        if tree_sitter is None:
+            raise RuntimeError("the tree-sitter backend needs tree-sitter and tree-sitter-java (pip install tree-sitter tree-sitter-java)")
+        self.parser = tree_sitter.Parser(tree_sitter.Language(tree_sitter_java.language()))
+
+    @staticmethod
+    def text(node):
+        return node.text.decode("utf-8")
+
+    def declared(self, node):
+        # (name node, type text) pairs declared by node
+        type_node = node.child_by_field_name("type")
+        if node.type == "catch_formal_parameter":
+            type_node = next((c for c in node.named_children if c.type == "catch_type"), None)
+        elif node.type == "spread_parameter":
+            type_node = next((c for c in node.named_children if c.type != "modifiers"), None)
+        if type_node is None:
+            return []
+        type_text = self.text(type_node) + ("..." if node.type == "spread_parameter" else "")
+
+        name = node.child_by_field_name("name")
+        if name is not None:
+            return [(name, type_text)]
+        pairs = []
+        for declarator in node.named_children:
+            if declarator.type != "variable_declarator":
+                continue
+            name = declarator.child_by_field_name("name")
+            dims = declarator.child_by_field_name("dimensions")
+            declarator_type = type_text + (self.text(dims) if dims is not None else "")
+            if type_text == "var":
+                value = declarator.child_by_field_name("value")
+                if value is None or value.type != "object_creation_expression":
+                    continue
+                declarator_type = self.text(value.child_by_field_name("type"))
+            pairs.append((name, declarator_type))
+        return pairs
+
+    @staticmethod
+    def header_row(node):
+        # First row of a declaration after its annotations: modifiers, type parameters, type or name
+        for child in node.children:
+            if child.type != "modifiers":
+                return child.start_point[0]
+            for modifier in child.children:
+                if modifier.type not in ("annotation", "marker_annotation"):
+                    return modifier.start_point[0]
+        return node.start_point[0]
+
+    def parse(self, lines):
+        tree = self.parser.parse("\n".join(lines).encode("utf-8"))
+        method_ranges = []
+        method_declarations = []
+        classes = []
+        call_sites = []
+
+        # (node, index into classes of the enclosing class body, header row of the enclosing method)
+        stack = [(tree.root_node, None, None)]
+        while stack:
+            node, class_pos, method_row = stack.pop()
+            kind = node.type
+            if kind in self.class_types:
+                body = node.child_by_field_name("body")
+                if body is not None:
+                    classes.append([node.start_point[0], body.end_point[0], {}])
+                    class_pos = len(classes) - 1
+                    method_row = None
+            elif kind in self.method_types:
+                body = node.child_by_field_name("body")
+                if body is not None:
+                    method_row = self.header_row(node)
+                    method_ranges.append((method_row, body.end_point[0], body.start_point[0]))
+            elif kind in self.parameter_types or kind in self.local_types:
+                if method_row is not None:
+                    for name, type_text in self.declared(node):
+                        row = name.start_point[0] if kind in self.local_types else method_row
+                        method_declarations.append((name.start_point, row, self.text(name), simple_type_name(type_text)))
+            elif kind in self.field_types:
+                if class_pos is not None and method_row is None:
+                    for name, type_text in self.declared(node):
+                        classes[class_pos][2].setdefault(self.text(name), simple_type_name(type_text))
+            elif kind == "method_invocation":
+                receiver = node.child_by_field_name("object")
+                if receiver is not None and receiver.type == "field_access":
+                    receiver = receiver.child_by_field_name("field")
+                if receiver is not None and receiver.type in self.receiver_types:
+                    name = node.child_by_field_name("name")
+                    arguments = node.child_by_field_name("arguments")
+                    args = mask_source(self.text(arguments)[1:-1]) if arguments is not None else None
+                    call_sites.append((name.start_point[0] + 1, name.start_point[1], self.text(receiver), self.text(name), args))
+            for child in reversed(node.children):
+                stack.append((child, class_pos, method_row))
+
+        return build_analysis(lines, method_ranges, method_declarations, classes, call_sites)
+
+
+# Modifier keywords (and whitespace) running up to the end of the searched span
+modifiers_tail_pattern = re.compile(
+    r"(?:\b(?:public|protected|private|static|final|abstract|synchronized|native|strictfp|default)\s+)+\Z"
+)
+
+
+def balanced_close(masked, open_offset, open_char, close_char):
+    depth = 0
+    for pos in range(open_offset, len(masked)):
+        char = masked[pos]
+        if char == open_char:
+            depth += 1
+        elif char == close_char:
+            depth -= 1
+            if not depth:
+                return pos
+    return None
+
+
+class JavalangBackend(ParserBackend):
+    name = "javalang"
+
+    def __init__(self):
+        super().__init__()
+        if javalang is None:
+            raise RuntimeError("the javalang backend needs javalang (pip install javalang)")
+
+    @staticmethod
+    def type_name(type_node, declarator=None):
+        # javalang splits qualified types into a sub_type chain
+        while getattr(type_node, "sub_type", None) is not None:
+            type_node = type_node.sub_type
+        name = type_node.name
+        dims = len(type_node.dimensions or [])
+        if declarator is not None:
+            dims += len(getattr(declarator, "dimensions", None) or [])
+            if name == "var":
+                initializer = getattr(declarator, "initializer", None)
+                if not isinstance(initializer, javalang.tree.ClassCreator):
+                    return None
+                return JavalangBackend.type_name(initializer.type)
+        return name + "[]" * dims
+
+    def parse(self, lines):
+        code = "\n".join(lines)
+        masked = mask_source(code)
+        line_starts = [0]
+        for line in lines[:-1]:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+
+        def offset(position):
+            return line_starts[position.line - 1] + position.column - 1
+
+        def line_of(pos):
+            return bisect_right(line_starts, pos) - 1
+
+        def header_start(node):
+            # javalang positions a method at its type parameters, type or name;
+            # the modifier keywords before that belong to the header too, the
+            # annotations do not
+            pos = offset(node.position)
+            tail = modifiers_tail_pattern.search(masked, max(pos - 200, 0), pos)
+            return tail.start() if tail else pos
+
+        def body_range(node):
+            # javalang has no end positions: from the declaration, the first "{"
+            # outside parentheses opens the body, and its matching "}" closes it
+            if node.position is None:
+                return None
+            depth = 0
+            for pos in range(max(offset(node.position) - 1, 0), len(masked)):
+                char = masked[pos]
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                elif char == ";" and not depth:
+                    return None
+                elif char == "{" and not depth:
+                    close = balanced_close(masked, pos, "{", "}")
+                    return (line_of(pos), line_of(close)) if close is not None else None
+            return None
+
+        tree = javalang.parse.parse(code)
+        method_types = (javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration)
+        class_types = (
+            javalang.tree.ClassDeclaration, javalang.tree.InterfaceDeclaration,
+            javalang.tree.EnumDeclaration, javalang.tree.AnnotationDeclaration
+        )
+        method_ranges = []
+        method_rows = {}
+        method_declarations = []
+        class_index = {}
+        classes = []
+
+        for path, node in tree:
+            if isinstance(node, class_types):
+                span = body_range(node)
+                if span is not None:
+                    class_index[id(node)] = len(classes)
+                    classes.append([line_of(offset(node.position)), span[1], {}])
+            elif isinstance(node, method_types):
+                span = body_range(node)
+                if span is not None:
+                    start = line_of(header_start(node))
+                    method_ranges.append((start, span[1], span[0]))
+                    method_rows[id(node)] = start
+
+        order = 0
+        for path, node in tree:
+            owners = [p for p in path if not isinstance(p, list)]
+            method = next((p for p in owners if isinstance(p, method_types) and id(p) in method_rows), None)
+            if isinstance(node, javalang.tree.FieldDeclaration):
+                owner = owners[-1] if owners else None
+                if owner is None or id(owner) not in class_index:
+                    continue
+                for declarator in node.declarators:
+                    type_name = self.type_name(node.type, declarator)
+                    if type_name is not None:
+                        classes[class_index[id(owner)]][2].setdefault(declarator.name, type_name)
+            elif method is None:
+                continue
+            elif isinstance(node, javalang.tree.FormalParameter):
+                order += 1
+                type_name = self.type_name(node.type) + ("[]" if node.varargs else "")
+                method_declarations.append((order, method_rows[id(method)], node.name, type_name))
+            elif isinstance(node, javalang.tree.CatchClauseParameter):
+                order += 1
+                method_declarations.append((order, method_rows[id(method)], node.name, node.types[-1].split(".")[-1]))
+            elif isinstance(node, javalang.tree.VariableDeclaration):
+                for declarator in node.declarators:
+                    type_name = self.type_name(node.type, declarator)
+                    if type_name is not None:
+                        order += 1
+                        method_declarations.append((order, method_rows[id(method)], declarator.name, type_name))
+
+        # Calls from the token stream: receiver "." name "("
+        call_sites = []
+        tokens = list(javalang.tokenizer.tokenize(code))
+        for i in range(len(tokens) - 3):
+            receiver, dot, name, paren = tokens[i:i + 4]
+            if dot.value != "." or paren.value != "(" or not isinstance(name, javalang.tokenizer.Identifier):
+                continue
+            if not (isinstance(receiver, javalang.tokenizer.Identifier) or receiver.value in ("this", "super")):
+                continue
+            # Not a call when the chain is the type of "new a.b.C(...)"
+            start = i
+            while start >= 2 and tokens[start - 1].value == "." and isinstance(tokens[start - 2], javalang.tokenizer.Identifier):
+                start -= 2
+            if start and tokens[start - 1].value == "new":
+                continue
+            # Search from one column early, whether columns count from 0 or 1
+            open_offset = masked.find("(", max(offset(paren.position) - 1, 0))
+            close = balanced_close(masked, open_offset, "(", ")")
+            args = masked[open_offset + 1:close] if close is not None else None
+            call_sites.append((name.position.line, name.position.column, receiver.value, name.value, args))
+
+        return build_analysis(lines, method_ranges, method_declarations, classes, call_sites)
+
+
+BACKENDS = {
+    "regex": RegexBackend,
+    "tree-sitter": TreeSitterBackend,
+    "javalang": JavalangBackend
+}
+
+
+def available_backends():
+    names = ["regex"]
+    if tree_sitter is not None:
+        names.append("tree-sitter")
+    if javalang is not None:
+        names.append("javalang")
+    return names
+
+
+def get_backend(name="regex"):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown parser backend {name!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from instrumentation import stats
+
+
+class ResultWriter:
+    # Streams match rows to a CSV in fixed-size batches instead of collecting them
+    # all for one DataFrame at the end. Memory stays flat, and rows written before
+    # a crash are kept. Each batch goes through pandas, so the file is formatted
+    # exactly like a single DataFrame(all_matches).to_csv(path, index=False).
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.rows_written = 0
+        self.file = open(path, "w", encoding="utf-8", newline="")
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with stats.stage("write"):
+            pd.DataFrame(self.buffer).to_csv(self.file, header=self.rows_written == 0, index=False)
+            self.file.flush()
+        stats.count("rows_written", len(self.buffer))
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.rows_written == 0 and not self.buffer:
+            # Same output as an empty DataFrame
+            pd.DataFrame([]).to_csv(self.file, index=False)
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
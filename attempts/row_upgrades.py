@@ -0,0 +1,65 @@
+from collections import defaultdict, deque
+
+import pandas as pd
+
+# Columns an F -> T upgrade overwrites
+UPGRADE_COLUMNS = ["Matched", "File", "LineNumber", "LineContent", "MotherLine", "MotherBody", "DeclaredType"]
+
+
+def entry_key(model, package, function_name):
+    return (model, package, function_name)
+
+
+class UnmatchedIndex:
+    # Row labels of the Matched == "F" rows, per (Model, Package, FunctionName) and
+    # in file order, so finding the row a match upgrades is one dict lookup instead
+    # of a boolean mask over the whole results frame
+    def __init__(self, df):
+        self.rows = defaultdict(deque)
+        unmatched = df[df["Matched"] == "F"]
+        for idx, model, package, function_name in zip(
+            unmatched.index, unmatched["Model"], unmatched["Package"], unmatched["FunctionName"]
+        ):
+            self.rows[entry_key(model, package, function_name)].append(idx)
+
+    def __contains__(self, key):
+        return bool(self.rows.get(key))
+
+    def first(self, key):
+        rows = self.rows.get(key)
+        return rows[0] if rows else None
+
+    def take(self, key):
+        # First F row for key, which is then no longer unmatched
+        rows = self.rows.get(key)
+        return rows.popleft() if rows else None
+
+
+def apply_upgrades(df, upgrades, columns=UPGRADE_COLUMNS):
+    # upgrades maps a row label to {column: value}; all rows are written in one
+    # assignment per column. Columns are made object first, since the values
+    # (ints, (start, end) tuples) do not fit string/float columns.
+    if not upgrades:
+        return
+    index = list(upgrades)
+    for column in columns:
+        df[column] = df[column].astype(object)
+        df.loc[index, column] = pd.Series([upgrades[idx][column] for idx in index], index=index, dtype=object)
+
+
+def merged_rows(df, insertion_rows):
+    # The existing rows in order, each followed by the new matches for its key.
+    # New matches are grouped by key once; each copy takes the ID of the row it
+    # follows with the last "-N" part incremented.
+    inserted = defaultdict(list)
+    for key, row in insertion_rows:
+        inserted[key].append(row)
+    for row in df.to_dict("records"):
+        yield row
+        new_rows = inserted.get(entry_key(row["Model"], row["Package"], row["FunctionName"]))
+        if not new_rows:
+            continue
+        prefix, _, suffix = row["ID"].rpartition("-")
+        new_id = f"{prefix}-{int(suffix) + 1}"
+        for new_row in new_rows:
+            yield {**new_row, "ID": new_id}
@@ -0,0 +1,84 @@
+import ast
+import csv
+import hashlib
+import os
+import pickle
+
+
+# Bump when the fields of SummaryEntry or the parsing change, so cached entries are reparsed
+SUMMARIES_VERSION = 1
+
+
+class SummaryEntry:
+    # One parsed YAML summary row. Attribute names follow the columns the scripts
+    # used to add with extract_summary_fields, so entry.Model, entry.Package (the
+    # class), entry.FunctionName, entry.ArgCount, ... read the same as before.
+    __slots__ = (
+        "FileName", "Model", "Package", "Subtypes", "FunctionName", "Signature", "Ext",
+        "Input", "Output", "Kind", "Provenance", "ParamTypes", "ArgCount", "Summary", "SummaryStr"
+    )
+
+    def __init__(self, file_name, summary_str):
+        self.FileName = file_name
+        for field in self.__slots__[1:]:
+            setattr(self, field, None)
+        self.Summary = summary_str
+        self.SummaryStr = summary_str
+        try:
+            parsed = ast.literal_eval(summary_str)
+        except Exception:
+            return
+        if not (isinstance(parsed, list) and len(parsed) > 4):
+            return
+        arg_signature = parsed[4]
+        types_list = []
+        if arg_signature and arg_signature != "()":
+            types_list = [
+                t.strip().split()[-1].split(".")[-1] for t in arg_signature.strip("()").split(",")
+            ]
+        fields = parsed + [None] * (10 - len(parsed))
+        self.Model = fields[0]
+        self.Package = fields[1]
+        self.Subtypes = fields[2]
+        self.FunctionName = fields[3]
+        self.Signature = fields[4]
+        self.Ext = fields[5]
+        self.Input = fields[6]
+        self.Output = fields[7]
+        self.Kind = fields[8]
+        self.Provenance = fields[9]
+        self.ParamTypes = types_list
+        self.ArgCount = len(types_list)
+        self.Summary = parsed
+        self.SummaryStr = str(parsed)
+
+    def __getstate__(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __setstate__(self, state):
+        for field in self.__slots__:
+            setattr(self, field, state.get(field))
+
+
+def parse_summary(summary_str, file_name=None):
+    return SummaryEntry(file_name, summary_str)
+
+
+# Parse the summaries CSV once; the parsed entries are cached under cache/ keyed
+# by SUMMARIES_VERSION and the CSV content, so later runs skip the literal_eval
+# pass entirely
+def load_summaries(path="data/yaml_summaries.csv", cache_dir="cache"):
+    with open(path, "rb") as f:
+        raw = f.read()
+    cache_path = os.path.join(cache_dir, f"summaries-v{SUMMARIES_VERSION}-{hashlib.sha1(raw).hexdigest()}.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        entries = [parse_summary(row["Summary"], row.get("File Name")) for row in csv.DictReader(f)]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, "wb") as f:
+        pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return entries
@@ -0,0 +1,207 @@
+import argparse
+import csv
+import os
+import random
+import re
+import sys
+
+from summaries import load_summaries
+
+identifier_pattern = re.compile(r"^[A-Za-z_$][\w$]*$")
+
+TRUTH_COLUMNS = ["File", "LineNumber", "Model", "Package", "FunctionName", "ArgCount", "EntryIndex"]
+
+# Filler statements; {i} makes names unique within a file, {n} is a number. Braces, calls and declarations
+# inside literals and comments are there to trip naive scanners.
+FILLER = [
+    "int n{i} = {n} * 31 + 7;",
+    "String s{i} = \"text {{ with }} braces and x.call({n})\";",
+    "// commented call: value{i}.remove(key{i});",
+    "long t{i} = System.nanoTime();",
+    "if (a > {n}) {{ sum -= 1; }}",
+    "for (int k{i} = 0; k{i} < 3; k{i}++) {{ sum += k{i}; }}",
+    "Object o{i} = new Object();",
+    "/* block comment {{ with a brace */ int q{i} = 0;",
+    "char c{i} = '{{';",
+]
+
+
+def plantable(entries):
+    # Entries the matchers can find at a receiver.method(...) call: a named
+    # top-level class, a method name that is not the constructor
+    chosen = []
+    for index, entry in enumerate(entries, start=1):
+        if not (entry.Model and entry.Package and entry.FunctionName):
+            continue
+        if "$" in entry.Package or "." in entry.Package or not identifier_pattern.match(entry.FunctionName):
+            continue
+        if entry.FunctionName == entry.Package or entry.ArgCount is None:
+            continue
+        chosen.append((index, entry))
+    return chosen
+
+
+class CorpusGenerator:
+    def __init__(self, entries, seed=0, methods_per_file=8, statements_per_method=12,
+                 plant_rate=0.2, max_per_signature=10, decoy_rate=0.2):
+        self.random = random.Random(seed)
+        self.entries = plantable(entries)
+        self.methods_per_file = methods_per_file
+        self.statements_per_method = statements_per_method
+        self.plant_rate = plant_rate
+        self.decoy_rate = decoy_rate
+        # Matchers cap matches per entry (at most 10), so each (class, method,
+        # arity) is planted at most this often to keep the ground truth exact
+        self.max_per_signature = max_per_signature
+        self.planted_per_signature = {}
+        self.planted = []
+
+    def pick_entry(self):
+        for _ in range(20):
+            index, entry = self.random.choice(self.entries)
+            key = (entry.Package, entry.FunctionName, entry.ArgCount)
+            if self.planted_per_signature.get(key, 0) < self.max_per_signature:
+                self.planted_per_signature[key] = self.planted_per_signature.get(key, 0) + 1
+                return index, entry
+        return None
+
+    def render_file(self, package, class_name, filename):
+        imports = {}
+        methods = []
+        for m in range(self.methods_per_file):
+            statements = []
+            for i in range(self.statements_per_method):
+                statements.append(("filler", self.random.choice(FILLER).format(i=f"{m}_{i}", n=i)))
+            if self.entries and self.random.random() < self.plant_rate:
+                picked = self.pick_entry()
+                if picked is not None:
+                    index, entry = picked
+                    # One simple name per file, from one package
+                    if imports.setdefault(entry.Package, entry.Model) == entry.Model:
+                        position = self.random.randrange(len(statements) + 1)
+                        statements.insert(position, ("plant", (index, entry, m)))
+                    else:
+                        self.planted_per_signature[(entry.Package, entry.FunctionName, entry.ArgCount)] -= 1
+            if self.entries and self.random.random() < self.decoy_rate:
+                # Same method name on a receiver of another type: must not match
+                _, entry = self.random.choice(self.entries)
+                statements.append(("filler", f"Object decoy{m} = null;"))
+                statements.append(("filler", f"decoy{m}.{entry.FunctionName}({', '.join(['null'] * entry.ArgCount)});"))
+            methods.append(statements)
+
+        lines = [f"package {package};", ""]
+        for simple_name, model in sorted(imports.items()):
+            lines.append(f"import {model}.{simple_name};")
+        lines += ["", f"public class {class_name} {{", "    private int sum;", ""]
+        for m, statements in enumerate(methods):
+            lines.append(f"    public void method{m}(int a, String b) {{")
+            for kind, statement in statements:
+                if kind == "filler":
+                    lines.append(f"        {statement}")
+                    continue
+                index, entry, method_number = statement
+                receiver = f"target{method_number}_{len(lines)}"
+                lines.append(f"        {entry.Package} {receiver} = null;")
+                lines.append(f"        {receiver}.{entry.FunctionName}({', '.join(['null'] * entry.ArgCount)});")
+                self.planted.append({
+                    "File": filename,
+                    "LineNumber": len(lines),
+                    "Model": entry.Model,
+                    "Package": entry.Package,
+                    "FunctionName": entry.FunctionName,
+                    "ArgCount": entry.ArgCount,
+                    "EntryIndex": index
+                })
+            lines.append("    }")
+            lines.append("")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def generate(self, output, files, packages=10, depth=2, relative_to=None):
+        relative_to = relative_to or os.path.dirname(os.path.abspath(output))
+        for n in range(files):
+            # Spread files over packages nested depth levels deep
+            package_number = n % packages
+            parts = [f"p{package_number}"] + [f"sub{(package_number + level) % 3}" for level in range(1, depth)]
+            directory = os.path.join(output, *parts)
+            os.makedirs(directory, exist_ok=True)
+            class_name = f"Generated{n}"
+            path = os.path.join(directory, f"{class_name}.java")
+            filename = os.path.relpath(path, relative_to)
+            package = "synthetic." + ".".join(parts)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.render_file(package, class_name, filename))
+        return self.planted
+
+
+def write_truth(path, planted):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TRUTH_COLUMNS)
+        writer.writeheader()
+        writer.writerows(planted)
+
+
+def read_sites(path, matched_only=False):
+    sites = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if matched_only and row.get("Matched") != "T":
+                continue
+            if row["File"] and row["LineNumber"]:
+                sites.add((row["File"], int(float(row["LineNumber"]))))
+    return sites
+
+
+def check(truth_path, results_path):
+    # Compare the matched (File, LineNumber) sites in the synthetic files with the planted ones
+    planted = read_sites(truth_path)
+    prefixes = {os.path.dirname(f).split(os.sep)[0] for f, _ in planted}
+    found = {s for s in read_sites(results_path, matched_only=True) if s[0].split(os.sep)[0] in prefixes}
+    missing = sorted(planted - found)
+    unexpected = sorted(found - planted)
+    print(f"planted {len(planted)}, found {len(found)}, missing {len(missing)}, unexpected {len(unexpected)}")
+    for filename, line_number in missing[:20]:
+        print(f"  missing    {filename}:{line_number}")
+    for filename, line_number in unexpected[:20]:
+        print(f"  unexpected {filename}:{line_number}")
+    return not missing and not unexpected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Java corpus with planted summary calls, or check results against it")
+    sub = parser.add_subparsers(dest="command", required=True)
+    generate = sub.add_parser("generate", help="write a corpus and its ground-truth CSV")
+    generate.add_argument("output", help="corpus directory, e.g. data/synthetic-10k")
+    generate.add_argument("--files", type=int, default=1000)
+    generate.add_argument("--packages", type=int, default=10)
+    generate.add_argument("--depth", type=int, default=2, help="directory levels per package")
+    generate.add_argument("--methods", type=int, default=8, help="methods per file")
+    generate.add_argument("--statements", type=int, default=12, help="filler statements per method")
+    generate.add_argument("--plant-rate", type=float, default=0.2, help="share of methods with a planted call")
+    generate.add_argument("--decoy-rate", type=float, default=0.2, help="share of methods with a same-name call on another type")
+    generate.add_argument("--max-per-signature", type=int, default=10)
+    generate.add_argument("--summaries", default="data/yaml_summaries.csv")
+    generate.add_argument("--relative-to", default=None, help="root file names are recorded against (default: parent of output)")
+    generate.add_argument("--truth", help="ground-truth CSV (default: <output>.planted.csv)")
+    generate.add_argument("--seed", type=int, default=0)
+    check_parser = sub.add_parser("check", help="compare a results CSV with the planted calls")
+    check_parser.add_argument("truth")
+    check_parser.add_argument("results")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generator = CorpusGenerator(
+            load_summaries(args.summaries), seed=args.seed, methods_per_file=args.methods,
+            statements_per_method=args.statements, plant_rate=args.plant_rate,
+            max_per_signature=args.max_per_signature, decoy_rate=args.decoy_rate
+        )
+        planted = generator.generate(args.output, args.files, args.packages, args.depth, args.relative_to)
+        truth = args.truth or f"{args.output.rstrip(os.sep)}.planted.csv"
+        write_truth(truth, planted)
+        print(f"Wrote {args.files} files to {args.output}, {len(planted)} planted calls listed in {truth}")
+    elif not check(args.truth, args.results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
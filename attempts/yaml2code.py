@@ -0,0 +1,131 @@
+import argparse
+import cProfile
+import os
+from contextlib import ExitStack
+from functools import partial
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+from corpus import write_pack
+from instrumentation import stats, write_profile
+from columnar_results import ColumnarResultWriter
+from match_engine import (OUTPUTS, MatchOptions, init_worker, load_state, match_shard, match_shard_with_stats,
+                          shards_of, state)
+from parser_backends import BACKENDS
+from result_writer import ResultWriter
+
+
+# With --format parquet/feather each output becomes <output>.matches.* and <output>.methods.*
+def open_writer(path, args):
+    if args.format == "csv":
+        return ResultWriter(path, batch_size=args.batch_size)
+    return ColumnarResultWriter(os.path.splitext(path)[0], args.format, batch_size=args.batch_size)
+
+
+def saved_to(writer, path):
+    if isinstance(writer, ColumnarResultWriter):
+        return f"{writer.match_path} and {writer.method_path}"
+    return path
+
+
+# One scan of the corpus, every requested output variant written from it:
+#   --full       every match per entry (extract_method_full_id.py)
+#   --top        at most --top-n matches per entry (matched_at_most_10.py); the
+#                first ones, or a seeded sample across subprojects with --sample-seed
+#   --filtered   full without long-method first matches (tools/cleanup_the_long.py)
+#   --unmatched  the F rows only, for re-checking against another corpus
+def run_match(args):
+    outputs = {output: getattr(args, output) for output in OUTPUTS if getattr(args, output)}
+    load_state(args.root, args.backend, args.relative_to, args.summaries)
+    total = len(state["entries"])
+    shards = shards_of(total, args.shard_size)
+    options = MatchOptions(
+        outputs=tuple(outputs), top_n=args.top_n, max_span=args.max_span,
+        import_filter=not args.no_import_filter, sample_seed=args.sample_seed
+    )
+
+    # Shards come back in submission order, so rows and IDs are the same as a serial run
+    with ExitStack() as stack:
+        writers = {output: stack.enter_context(open_writer(path, args))
+                   for output, path in outputs.items()}
+        progress = stack.enter_context(tqdm(total=total))
+
+        def write(shard_rows):
+            for rows in shard_rows:
+                for output, writer in writers.items():
+                    writer.write_rows(rows[output])
+
+        if args.workers > 1:
+            # Workers are not under the profiler; their stage stats are merged here
+            initargs = (args.root, args.backend, args.relative_to, args.summaries)
+            with Pool(args.workers, initializer=init_worker, initargs=initargs) as pool:
+                for done, shard_rows, shard_stats in pool.imap(partial(match_shard_with_stats, options=options), shards):
+                    stats.merge(shard_stats)
+                    write(shard_rows)
+                    progress.update(done)
+        else:
+            for shard in shards:
+                done, shard_rows = match_shard(shard, options)
+                write(shard_rows)
+                progress.update(done)
+
+    for output, path in outputs.items():
+        print(f"{output:10} {writers[output].rows_written:8} rows saved to {saved_to(writers[output], path)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match YAML summaries against a Java corpus")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    match = sub.add_parser("match", help="scan the corpus once and write any of the output variants")
+    match.add_argument("--root", default="data", help="corpus directory to scan, or a pack written by the pack command")
+    match.add_argument("--relative-to", default="data", help="directory the File column is relative to (set by the pack for packs)")
+    match.add_argument("--summaries", default="data/yaml_summaries.csv")
+    match.add_argument("--full", help="CSV with every match per entry")
+    match.add_argument("--top", help="CSV with at most --top-n matches per entry")
+    match.add_argument("--top-n", type=int, default=10)
+    match.add_argument("--sample-seed", type=int, default=None,
+                       help="sample --top-n matches per entry, spread across subprojects, instead of the first ones")
+    match.add_argument("--filtered", help="full CSV without first matches in methods longer than --max-span lines")
+    match.add_argument("--max-span", type=int, default=1000)
+    match.add_argument("--unmatched", help="CSV with only the entries nothing matched (F rows)")
+    match.add_argument("--format", choices=["csv", "parquet", "feather"], default="csv",
+                       help="parquet/feather write <output>.matches.* and <output>.methods.* per output (needs pyarrow)")
+    match.add_argument("--no-import-filter", action="store_true",
+                       help="also match in files that do not import the YAML class (as extract_method_full_id.py did)")
+    match.add_argument("--backend", choices=sorted(BACKENDS), default="regex",
+                       help="how Java files are analyzed (tree-sitter/javalang need their library installed)")
+    match.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    match.add_argument("--shard-size", type=int, default=50, help="entries per work unit")
+    match.add_argument("--batch-size", type=int, default=1000, help="rows buffered before each write")
+    match.add_argument("--profile", action="store_true",
+                       help="run under cProfile; write <first output>.prof and .profile.json next to the first output")
+
+    pack = sub.add_parser("pack", help="write a corpus directory into one memory-mappable snapshot file")
+    pack.add_argument("output", help="pack file, e.g. data.pack")
+    pack.add_argument("--root", default="data", help="corpus directory")
+    pack.add_argument("--relative-to", default="data", help="directory the stored file names are relative to")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        files, size = write_pack(args.root, args.output, args.relative_to)
+        print(f"Packed {files} files ({size / 1e6:.1f} MB) from {args.root} into {args.output}")
+    elif args.command == "match":
+        paths = [getattr(args, output) for output in OUTPUTS if getattr(args, output)]
+        if not paths:
+            parser.error("match: give at least one of --full, --top, --filtered, --unmatched")
+        profiler = cProfile.Profile() if args.profile else None
+        if profiler:
+            profiler.enable()
+        run_match(args)
+        if profiler:
+            profiler.disable()
+            prefix = os.path.splitext(paths[0])[0]
+            print(write_profile(profiler, prefix))
+            print(stats.report())
+            print(f"Profile saved to {prefix}.prof and {prefix}.profile.json")
+
+
+if __name__ == "__main__":
+    main()